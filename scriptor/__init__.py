@@ -1,5 +1,10 @@
 from .program import Program, BaseProgram
-from .process import Process, AsyncProcess, ProcessError
+from .process import Process, AsyncProcess, ProcessError, Tee
+from .pipeline import Pipeline, PipelineError
+from .output import Spool, SpooledOutput, Mapped, MappedOutput, Tail, TailOutput
+from .parsers import StreamParser, Delimited, NDJSON, CSV, TSV
+from .cache import MemoryCache, DiskCache, no_cache
+from .scheduler import Scheduler
 
 from . import _version
 __version__ = _version.get_versions()['version']
\ No newline at end of file
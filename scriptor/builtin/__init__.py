@@ -2,4 +2,6 @@ from .python import (
     Python,
     current as current_python,
     python as base_python
-)
\ No newline at end of file
+)
+from .pool import PythonPool
+from .zygote import Zygote
\ No newline at end of file
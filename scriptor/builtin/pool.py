@@ -0,0 +1,230 @@
+import os
+import sys
+import queue
+import pickle
+import struct
+import threading
+import subprocess
+from textwrap import dedent
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_HEADER = struct.Struct("!Q")
+
+# Code the worker interpreters run. Kept self-contained as
+# the interpreter may not have Scriptor installed.
+_WORKER_CODE = dedent("""
+    import builtins, importlib, io, os, pickle, runpy, struct, sys, traceback
+
+    HEADER = struct.Struct("!Q")
+
+    def get_rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            pass
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == "darwin" else rss * 1024
+        except ImportError:
+            return 0
+
+    def run(kind, target, argv, cwd, stdin, env=None):
+        stdout = io.BytesIO()
+        stderr = io.BytesIO()
+        encoding = getattr(sys.__stdout__, "encoding", None) or "utf-8"
+        saved = (sys.argv, sys.stdin, sys.stdout, sys.stderr, sys.path[:], os.getcwd(), set(sys.modules))
+        saved_env = dict(os.environ)
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin or b""), encoding=encoding)
+        sys.stdout = io.TextIOWrapper(stdout, encoding=encoding, write_through=True)
+        sys.stderr = io.TextIOWrapper(stderr, encoding=encoding, write_through=True)
+        returncode = 0
+        try:
+            if cwd is not None:
+                os.chdir(cwd)
+            if env is not None:
+                os.environ.clear()
+                os.environ.update(env)
+            if kind == "code":
+                sys.argv = ["-c"] + argv
+                sys.path.insert(0, "")
+                code = compile(target, "<string>", "exec")
+                exec(code, {"__name__": "__main__", "__builtins__": builtins})
+            elif kind == "module":
+                sys.argv = [target] + argv
+                sys.path.insert(0, os.getcwd())
+                runpy.run_module(target, run_name="__main__", alter_sys=True)
+            else:
+                sys.argv = [target] + argv
+                sys.path.insert(0, os.path.dirname(os.path.abspath(target)))
+                runpy.run_path(target, run_name="__main__")
+        except SystemExit as exc:
+            if exc.code is None:
+                returncode = 0
+            elif isinstance(exc.code, int):
+                returncode = exc.code
+            else:
+                print(exc.code, file=sys.stderr)
+                returncode = 1
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            output = stdout.getvalue(), stderr.getvalue()
+            sys.argv, sys.stdin, sys.stdout, sys.stderr, sys.path[:], cwd, modules = saved
+            os.chdir(cwd)
+            if env is not None:
+                os.environ.clear()
+                os.environ.update(saved_env)
+            # Forget the modules the task imported (the preloaded stay)
+            for name in set(sys.modules) - modules:
+                del sys.modules[name]
+        return (returncode,) + output + (get_rss(),)
+
+    def main():
+        # The pipes are reserved for the protocol, the
+        # tasks' output is captured separately
+        proto_in = os.fdopen(os.dup(0), "rb")
+        proto_out = os.fdopen(os.dup(1), "wb")
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, 0)
+        os.dup2(devnull, 1)
+        for module in sys.argv[1:]:
+            importlib.import_module(module)
+        while True:
+            header = proto_in.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            task = pickle.loads(proto_in.read(HEADER.unpack(header)[0]))
+            result = pickle.dumps(run(*task), 4)
+            proto_out.write(HEADER.pack(len(result)) + result)
+            proto_out.flush()
+
+    main()
+""")
+
+class _Worker:
+    "Warm interpreter running tasks one at a time"
+
+    def __init__(self, interpreter:List[str], preload:Iterable[str]):
+        self._proc = subprocess.Popen(
+            [*interpreter, "-c", _WORKER_CODE, *preload],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.tasks = 0
+        self.rss = 0
+
+    def run(self, task:tuple, timeout=None) -> Tuple[int, bytes, bytes]:
+        data = pickle.dumps(task, 4)
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, self._proc.kill)
+            timer.start()
+        try:
+            self._proc.stdin.write(_HEADER.pack(len(data)) + data)
+            self._proc.stdin.flush()
+            header = self._proc.stdout.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise EOFError
+            returncode, stdout, stderr, self.rss = pickle.loads(self._proc.stdout.read(_HEADER.unpack(header)[0]))
+        except (EOFError, OSError):
+            # The worker died during the task (killed or os._exit)
+            returncode = self._proc.wait()
+            if timer is not None and not timer.is_alive():
+                raise subprocess.TimeoutExpired(task[1], timeout)
+            return returncode, b'', b''
+        finally:
+            if timer is not None:
+                timer.cancel()
+        self.tasks += 1
+        return returncode, stdout, stderr
+
+    @property
+    def alive(self):
+        return self._proc.poll() is None
+
+    def close(self):
+        if self.alive:
+            self._proc.stdin.close()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired: # pragma: no cover
+                self._proc.kill()
+                self._proc.wait()
+        self._proc.stdout.close()
+
+class PythonPool:
+    """Pool of warm Python interpreters
+
+    The workers import the preloaded modules at start
+    and run the tasks (code, module or script) in-process.
+    A worker is replaced after max_tasks tasks or after
+    its resident memory exceeds max_memory (MB)."""
+
+    def __init__(self, interpreter=sys.executable, workers:int=None, preload:Iterable[str]=(), max_tasks:int=None, max_memory:float=None):
+        self.interpreter = [interpreter] if isinstance(interpreter, str) else list(interpreter)
+        self.workers = workers or os.cpu_count() or 1
+        self.preload = list(preload)
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(self.workers):
+            self._idle.put(self._spawn())
+
+    def run(self, kind:str, target:str, args:Iterable[str]=(), cwd=None, input:Optional[bytes]=None, timeout=None,
+            env:Optional[Dict[str, str]]=None) -> Tuple[int, bytes, bytes]:
+        """Run a task (kind is 'code', 'module' or 'script') and return returncode, stdout and stderr
+
+        The environment (env) replaces os.environ of the worker for the task."""
+        if kind not in ('code', 'module', 'script'):
+            raise ValueError(f"Invalid task kind: {kind}")
+        if self._closed:
+            raise RuntimeError("Pool is closed")
+        cwd = None if cwd is None else str(cwd)
+        worker = self._idle.get()
+        try:
+            env = None if env is None else dict(env)
+            return worker.run((kind, str(target), [str(arg) for arg in args], cwd, input, env), timeout=timeout)
+        finally:
+            if self._closed:
+                worker.close()
+            else:
+                self._idle.put(self._recycle(worker))
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self.interpreter, self.preload)
+        with self._lock:
+            self._all.append(worker)
+        return worker
+
+    def _recycle(self, worker:_Worker) -> _Worker:
+        exhausted = self.max_tasks is not None and worker.tasks >= self.max_tasks
+        bloated = self.max_memory is not None and worker.rss > self.max_memory * 2**20
+        if not worker.alive or exhausted or bloated:
+            worker.close()
+            with self._lock:
+                self._all.remove(worker)
+            return self._spawn()
+        return worker
+
+    def close(self):
+        "Close the workers"
+        self._closed = True
+        with self._lock:
+            workers = list(self._all)
+            self._all.clear()
+        for worker in workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,24 +1,96 @@
-from typing import Union
+from typing import Iterable, Union
 from pathlib import Path
 from scriptor import Program
+from scriptor.utils import iter_bytes
+from scriptor.process import Process, _raise_for_error
+from scriptor.runner import _open_files, _start_routes, _route_output
+from .pool import PythonPool
+from .zygote import Zygote
 import sys
 import platform
 
 
 class Python(Program):
 
+    pool:PythonPool = None
+    zygote:Zygote = None
+
     def __init__(self, interpreter, *args, **kwargs):
         super().__init__(interpreter, *args, **kwargs)
 
     def run_code(self, code:str):
+        if self.pool is not None:
+            return self._run_pooled('code', code)
+        if self.zygote is not None:
+            return self._run_forked('code', code)
         return self(c=code)
 
     def run_module(self, module:str):
+        if self.pool is not None:
+            return self._run_pooled('module', module)
+        if self.zygote is not None:
+            return self._run_forked('module', module)
         return self(m=module)
 
     def run_script(self, script:Union[str, Path], *args, **kwargs):
+        if self.pool is not None:
+            return self._run_pooled('script', script, *args, **kwargs)
+        if self.zygote is not None:
+            return self._run_forked('script', script, *args, **kwargs)
         return self(script, *args, **kwargs)
 
+    def use_pool(self, workers:int=None, preload:Iterable[str]=(), max_tasks:int=None, max_memory:float=None) -> 'Python':
+        "Run the code, modules and scripts in a pool of warm interpreters"
+        pool = PythonPool(
+            self.program,
+            workers=workers, preload=preload,
+            max_tasks=max_tasks, max_memory=max_memory
+        )
+        return self.use(pool=pool)
+
+    def use_zygote(self, preload:Iterable[str]=()) -> 'Python':
+        "Run the code, modules and scripts in children forked from a server with preloaded modules"
+        return self.use(zygote=Zygote(self.program, preload=preload))
+
+    def _run_pooled(self, kind:str, target, *args, **kwargs):
+        cmd, stdin = self.get_command(target, *args, **kwargs)
+        argv = cmd[len(self.program) + 1:]
+        if stdin is not None and not isinstance(stdin, bytes):
+            # The workers get the whole input at once
+            stdin = b''.join(iter_bytes(stdin))
+        returncode, stdout, stderr = self.pool.run(kind, target, argv, cwd=self.cwd, input=stdin, timeout=self.timeout, env=self.env)
+        # The workers capture the outputs, route them afterwards
+        stdout = _route_output(self.stdout, stdout)
+        stderr = _route_output(self.stderr, stderr)
+        _raise_for_error(returncode, cmd=cmd, stdout=stdout, stderr=stderr)
+        if not self.captures_output:
+            return None
+        return self.parse_output(stdout)
+
+    def _run_forked(self, kind:str, target, *args, **kwargs):
+        cmd, stdin = self.get_command(target, *args, **kwargs)
+        argv = cmd[len(self.program) + 1:]
+        routes = {
+            'stdout': 'capture' if self.stdout is None else self.stdout,
+            'stderr': 'capture' if self.stderr is None else self.stderr,
+        }
+        with _open_files(stdin, routes) as (stdin, stdio):
+            proc = Process(self.zygote.start(kind, target, argv, cwd=self.cwd, env=self.env, **stdio), cmd=cmd)
+        _start_routes(proc, routes)
+        if stdin is not None:
+            proc.write(stdin)
+        elif proc.stdin is not None:
+            proc.stdin.close()
+        try:
+            proc.finish(timeout=self.timeout)
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+        proc.raise_for_return()
+        if not self.captures_output:
+            return None
+        return self.parse_output(proc.get_stdout())
+
     @property
     def version(self):
         return self("-V")
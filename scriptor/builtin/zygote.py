@@ -0,0 +1,211 @@
+import os
+import sys
+import pickle
+import socket
+import threading
+import subprocess
+from textwrap import dedent
+from typing import Dict, Iterable, Optional
+
+from scriptor.spawn import RemoteProcess, _open_stdio, _send_fds, _HEADER
+
+# Code the zygote server runs. Kept self-contained as
+# the interpreter may not have Scriptor installed.
+_SERVER_CODE = dedent("""
+    import array, importlib, os, pickle, runpy, selectors, signal, socket, struct, sys, traceback
+
+    HEADER = struct.Struct("!Q")
+    STATUS = struct.Struct("!q")
+
+    def recv_exact(sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def recv_fds(sock, maxfds):
+        fds = array.array("i")
+        msg, ancdata, flags, addr = sock.recvmsg(1, socket.CMSG_LEN(maxfds * fds.itemsize))
+        for level, type_, data in ancdata:
+            if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+        return msg, list(fds)
+
+    def run_child(conn, stdio):
+        # In the forked child
+        for i, fd in enumerate(stdio):
+            os.dup2(fd, i)
+        for fd in set(stdio):
+            if fd > 2:
+                os.close(fd)
+        kind, target, argv, cwd, env = pickle.loads(recv_exact(conn, HEADER.unpack(recv_exact(conn, HEADER.size))[0]))
+        conn.close()
+        os.environ.clear()
+        os.environ.update(env)
+        os.chdir(cwd)
+        if "random" in sys.modules:
+            sys.modules["random"].seed()
+        returncode = 0
+        try:
+            sys.argv = [target] + argv
+            if kind == "code":
+                sys.argv[0] = "-c"
+                sys.path.insert(0, "")
+                exec(compile(target, "<string>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+            elif kind == "module":
+                sys.path.insert(0, cwd)
+                runpy.run_module(target, run_name="__main__", alter_sys=True)
+            else:
+                sys.path.insert(0, os.path.dirname(os.path.abspath(target)))
+                runpy.run_path(target, run_name="__main__")
+        except SystemExit as exc:
+            if exc.code is None:
+                returncode = 0
+            elif isinstance(exc.code, int):
+                returncode = exc.code
+            else:
+                print(exc.code, file=sys.stderr)
+                returncode = 1
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(returncode)
+
+    def main():
+        ctrl = socket.socket(fileno=int(sys.argv[1]))
+        for module in sys.argv[2:]:
+            importlib.import_module(module)
+
+        # Wake up the selector when a child finishes
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_w.setblocking(False)
+        signal.set_wakeup_fd(wakeup_w.fileno())
+        signal.signal(signal.SIGCHLD, lambda *args: None)
+
+        ctrl.sendall(b"R")
+        children = {}
+        selector = selectors.DefaultSelector()
+        selector.register(ctrl, selectors.EVENT_READ)
+        selector.register(wakeup_r, selectors.EVENT_READ)
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is wakeup_r:
+                    wakeup_r.recv(4096)
+                    continue
+                msg, fds = recv_fds(ctrl, 4)
+                if not msg:
+                    # The parent is gone
+                    return
+                conn, stdio = socket.socket(fileno=fds[0]), fds[1:]
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    signal.set_wakeup_fd(-1)
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    selector.close()
+                    ctrl.close()
+                    wakeup_r.close()
+                    wakeup_w.close()
+                    for other in children.values():
+                        other.close()
+                    run_child(conn, stdio)
+                for fd in stdio:
+                    os.close(fd)
+                conn.sendall(STATUS.pack(pid))
+                children[pid] = conn
+
+            # Report the finished children
+            while children:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+                conn = children.pop(pid)
+                try:
+                    conn.sendall(STATUS.pack(returncode))
+                except OSError:
+                    pass
+                conn.close()
+
+    main()
+""")
+
+class Zygote:
+    """Server process that has imported the preloaded
+    modules and forks a child per started task
+
+    The children get their own argv, cwd, environment
+    and stdio. Requires os.fork (POSIX only)."""
+
+    def __init__(self, interpreter=sys.executable, preload:Iterable[str]=()):
+        if not hasattr(os, 'fork'): # pragma: no cover
+            raise OSError("Zygote requires os.fork")
+        self.interpreter = [interpreter] if isinstance(interpreter, str) else list(interpreter)
+        self.preload = list(preload)
+
+        self._ctrl, child_ctrl = socket.socketpair()
+        self._proc = subprocess.Popen(
+            [*self.interpreter, "-c", _SERVER_CODE, str(child_ctrl.fileno()), *self.preload],
+            pass_fds=[child_ctrl.fileno()], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        )
+        child_ctrl.close()
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def start(self, kind:str, target:str, args:Iterable[str]=(), cwd=None, env:Optional[Dict[str, str]]=None,
+              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE) -> RemoteProcess:
+        "Start a task (kind is 'code', 'module' or 'script') in a forked child"
+        if kind not in ('code', 'module', 'script'):
+            raise ValueError(f"Invalid task kind: {kind}")
+        argv = [str(arg) for arg in args]
+        request = pickle.dumps((
+            kind, str(target), argv,
+            os.getcwd() if cwd is None else str(cwd),
+            dict(os.environ if env is None else env),
+        ), 4)
+
+        conn, child_conn = socket.socketpair()
+        child_fds, to_close, parent_files = _open_stdio(stdin, stdout, stderr)
+        try:
+            with self._lock:
+                self._wait_ready()
+                _send_fds(self._ctrl, b"S", [child_conn.fileno(), *child_fds])
+        finally:
+            child_conn.close()
+            for fd in to_close:
+                os.close(fd)
+        conn.sendall(_HEADER.pack(len(request)) + request)
+        return RemoteProcess([str(target), *argv], conn, *parent_files)
+
+    def _wait_ready(self):
+        if not self._ready:
+            if self._ctrl.recv(1) != b"R":
+                raise RuntimeError(f"Zygote failed to start (exit code {self._proc.wait()})")
+            self._ready = True
+
+    def close(self):
+        """Close the server
+
+        The running children are left running. Their
+        returncode is -1 when they finish as the exit
+        status is then not known."""
+        self._ctrl.close()
+        self._proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
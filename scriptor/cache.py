@@ -0,0 +1,228 @@
+import os
+import glob
+import time
+import pickle
+import shutil
+import hashlib
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    from typing import Literal
+except ImportError: # pragma: no cover
+    from typing_extensions import Literal
+
+# Set by no_cache()
+_bypass = ContextVar('scriptor_cache_bypass', default=False)
+
+@contextmanager
+def no_cache():
+    """Run the programs without their caches (the
+    outputs are not read from nor stored to them)
+
+    .. code-block:: python
+
+        with no_cache():
+            git('rev-parse', 'HEAD')
+    """
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def is_bypassed() -> bool:
+    return _bypass.get()
+
+def _resolve_executable(program:str, env:Dict[str, str], cwd) -> Tuple[str, int]:
+    "Get the path of the executable and its modification time"
+    if os.sep not in program and not (os.altsep and os.altsep in program):
+        program = shutil.which(program, path=env.get('PATH')) or program
+    elif cwd is not None:
+        program = os.path.join(cwd, program)
+    try:
+        return program, os.stat(program).st_mtime_ns
+    except OSError:
+        return program, 0
+
+@lru_cache(maxsize=1024)
+def _hash_file(path:str, size:int, mtime:int) -> str:
+    # Cached by the stat so unchanged files are read once
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fingerprint(path:Union[str, os.PathLike], mode:Literal['stat', 'hash']='stat') -> tuple:
+    """Get the fingerprint of a file: the size and the
+    modification time ('stat') or the hash of the content
+    ('hash'). None for files that do not exist."""
+    path = os.fspath(path)
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if mode == 'hash':
+        return _hash_file(path, stat.st_size, stat.st_mtime_ns)
+    return stat.st_size, stat.st_mtime_ns
+
+def _get_files(cmd:List[str], cwd:str, input_files:Iterable[str]) -> List[str]:
+    "Get the files in the arguments and matching the input files"
+    files = []
+    for arg in cmd[1:]:
+        path = os.path.join(cwd, arg)
+        if os.path.isfile(path):
+            files.append(path)
+    for pattern in input_files:
+        # Non-glob paths are included even if missing
+        matches = glob.glob(os.path.join(cwd, pattern), recursive=True)
+        files += sorted(matches) if glob.has_magic(pattern) else [os.path.join(cwd, pattern)]
+    return files
+
+def make_key(cmd:List[str], stdin:Union[bytes, os.PathLike, None]=None, cwd=None, env:Optional[Dict[str, str]]=None,
+             input_files:Iterable[str]=(), mode:Literal['stat', 'hash']='stat') -> str:
+    """Get the cache key of a call
+
+    The key is a hash of the command, the stdin, the cwd,
+    the environment (os.environ if None), the resolved
+    executable (a new version of it changes the key) and
+    the fingerprints of the files: the arguments that are
+    existing files, the stdin if it is a path and the
+    input_files (paths or globs relative to the cwd)."""
+    env = dict(os.environ if env is None else env)
+    cmd = list(map(str, cmd))
+    executable = _resolve_executable(cmd[0], env, cwd)
+    cwd = os.path.abspath(cwd if cwd is not None else os.getcwd())
+    files = _get_files(cmd, cwd, input_files)
+    if isinstance(stdin, os.PathLike):
+        files.append(os.path.join(cwd, stdin))
+        stdin = None
+    fingerprints = [(path, fingerprint(path, mode)) for path in files]
+    data = pickle.dumps((cmd, stdin, cwd, sorted(env.items()), executable, fingerprints))
+    return hashlib.sha256(data).hexdigest()
+
+class Cache(ABC):
+    """Base of the caches of program outputs
+
+    The values are the raw outputs (bytes) so the
+    programs sharing a cache can parse them differently."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key:str) -> Optional[bytes]:
+        "Get the output (None if not cached)"
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    @abstractmethod
+    def set(self, key:str, value:bytes):
+        "Store the output"
+
+    @abstractmethod
+    def clear(self):
+        "Remove all the outputs"
+
+    @abstractmethod
+    def _get(self, key:str) -> Optional[bytes]:
+        "Get the stored output (None if not stored)"
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses}
+
+class MemoryCache(Cache):
+    """Cache in memory that keeps the maxsize most recently
+    used outputs (all if None) for ttl seconds (forever
+    if None)"""
+
+    def __init__(self, maxsize:Optional[int]=128, ttl:Optional[float]=None):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def _get(self, key:str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key:str, value:bytes):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._items[key] = (expires, value)
+            self._items.move_to_end(key)
+            if self.maxsize is not None and len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+class DiskCache(Cache):
+    """Cache in a directory that persists between runs
+
+    Each output is a file named by its key. The outputs
+    older than ttl seconds (if given) are not used."""
+
+    def __init__(self, directory:Union[str, os.PathLike], ttl:Optional[float]=None):
+        super().__init__()
+        self.directory = os.fspath(directory)
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _get(self, key:str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if self.ttl is not None and os.stat(path).st_mtime + self.ttl < time.time():
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key:str, value:bytes):
+        # Written to a temporary file and renamed so
+        # that readers never see a partial output
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with open(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.unlink(self._path(name))
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if not name.startswith('.tmp'))
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from concurrent import futures
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """Runs identical concurrent calls once
+
+    The calls with the same key that start while the first
+    one is running wait for it and get its result (or its
+    exception). The sync and async calls are separate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls:Dict[Hashable, futures.Future] = {}
+        self._tasks:Dict[Hashable, list] = {}
+
+    def run(self, key:Hashable, func:Callable[[], Any]) -> Any:
+        "Run the function or wait for the call in flight"
+        with self._lock:
+            fut = self._calls.get(key)
+            is_leader = fut is None
+            if is_leader:
+                fut = self._calls[key] = futures.Future()
+        if not is_leader:
+            return fut.result()
+        try:
+            result = func()
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def run_async(self, key:Hashable, func:Callable[[], Awaitable]) -> Any:
+        "Run the coroutine function or wait for the call in flight"
+        key = (asyncio.get_running_loop(), key)
+        flight = self._tasks.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(func())
+            flight = self._tasks[key] = [task, 0]
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        task = flight[0]
+        flight[1] += 1
+        try:
+            # A cancelled caller does not cancel the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if flight[1] == 1 and not task.done():
+                # Nobody else waits for it
+                task.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    def __len__(self):
+        return len(self._calls) + len(self._tasks)
+
+# Shared by the programs
+FLIGHTS = SingleFlight()
@@ -0,0 +1,243 @@
+import io
+import mmap
+import tempfile
+from array import array
+from typing import IO, Iterator, Optional
+
+class MappedOutput:
+    """Output mapped to memory from a temporary file
+
+    Slicing gives memoryviews of the mapping (no copies)
+    and ``line(i)`` the lines by index. The ``view`` (a
+    memoryview) can be passed to anything that takes a
+    buffer, ie. ``numpy.frombuffer(output.view)``. The
+    output_parser of the program gets the ``view``."""
+
+    def __init__(self, file:Optional[IO]=None):
+        size = file.seek(0, io.SEEK_END) if file is not None else 0
+        # Empty files cannot be mapped
+        self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.view = memoryview(self._mmap if self._mmap is not None else b'')
+        self._offsets = None
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, key):
+        return self.view[key]
+
+    def __buffer__(self, flags):
+        # Python 3.12+, use the view otherwise
+        return memoryview(self.view)
+
+    def tobytes(self) -> bytes:
+        return self.view.tobytes()
+
+    def __bytes__(self):
+        return self.tobytes()
+
+    def find(self, sub:bytes, start:int=0, end:Optional[int]=None) -> int:
+        if self._mmap is None:
+            return -1
+        return self._mmap.find(sub, start, len(self) if end is None else end)
+
+    def _get_offsets(self) -> array:
+        "Get the start of each line (and the end of the output)"
+        if self._offsets is None:
+            offsets = array('q', [0])
+            pos = self.find(b'\n')
+            while pos != -1:
+                offsets.append(pos + 1)
+                pos = self.find(b'\n', pos + 1)
+            if offsets[-1] != len(self):
+                # No line break at the end
+                offsets.append(len(self))
+            self._offsets = offsets
+        return self._offsets
+
+    @property
+    def line_count(self) -> int:
+        return len(self._get_offsets()) - 1
+
+    def line(self, index:int) -> memoryview:
+        "Get a line (with the line break) by index"
+        offsets = self._get_offsets()
+        if index < 0:
+            index += len(offsets) - 1
+        if not 0 <= index < len(offsets) - 1:
+            raise IndexError("Line index out of range")
+        return self.view[offsets[index]:offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        "Iterate the lines (with the line breaks)"
+        for i in range(self.line_count):
+            yield self.line(i)
+
+    def close(self):
+        "Close the mapping (the views of it must be released first)"
+        self.view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"<MappedOutput size={len(self)}>"
+
+class SpooledOutput:
+    """Captured output that is kept in memory up to
+    max_size (bytes) and in a temporary file after that
+
+    The output is not read to memory unless asked:
+    use ``read()`` for all of it, iterate the lines
+    or map it to memory with ``mmap()``."""
+
+    def __init__(self, max_size:int):
+        self.max_size = max_size
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_size)
+        self._mapped = None
+        self._size = 0
+
+    def write(self, data:bytes) -> int:
+        size = self._file.write(data)
+        self._size += size
+        return size
+
+    @property
+    def spilled(self) -> bool:
+        "Whether the output was written to the disk"
+        return self._file._rolled
+
+    def __len__(self):
+        return self._size
+
+    def read(self) -> bytes:
+        "Read the whole output"
+        self._file.seek(0)
+        return self._file.read()
+
+    def __iter__(self) -> Iterator[bytes]:
+        "Iterate the lines of the output (with the line breaks)"
+        pos = 0
+        while True:
+            # Seek each time as the file is shared (ie. read())
+            self._file.seek(pos)
+            line = self._file.readline()
+            if not line:
+                return
+            pos += len(line)
+            yield line
+
+    def mmap(self) -> MappedOutput:
+        """Map the output to memory (read-only)
+
+        The output is moved to the disk if it is not
+        there already."""
+        if self._mapped is None:
+            self._file.rollover()
+            self._file.flush()
+            self._mapped = MappedOutput(self._file)
+        return self._mapped
+
+    def result(self) -> 'SpooledOutput':
+        "Get the result after the output is written"
+        return self
+
+    def close(self):
+        if self._mapped is not None:
+            self._mapped.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f"<SpooledOutput size={len(self)} spilled={self.spilled}>"
+
+class Spool:
+    """Capture the output in memory up to max_size
+    (bytes) and spill the rest to a temporary file
+
+    The result is a SpooledOutput."""
+
+    def __init__(self, max_size:int=64 * 2**20):
+        self.max_size = max_size
+
+    def create(self) -> SpooledOutput:
+        return SpooledOutput(self.max_size)
+
+class _MappedSink:
+    "Writes the output to a temporary file that is mapped at the end"
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+
+    def write(self, data:bytes) -> int:
+        return self._file.write(data)
+
+    def result(self) -> MappedOutput:
+        # The mapping stays after the file is closed
+        with self._file:
+            self._file.flush()
+            return MappedOutput(self._file)
+
+class Mapped(Spool):
+    """Capture the output to a temporary file and
+    map it to memory
+
+    The result is a MappedOutput."""
+
+    def __init__(self):
+        super().__init__(max_size=0)
+
+    def create(self) -> _MappedSink:
+        return _MappedSink()
+
+class TailOutput(bytes):
+    "End of an output (the count of the bytes before it is in dropped)"
+    dropped:int = 0
+
+class _TailSink:
+    "Ring buffer that keeps the last max_size bytes written to it"
+
+    def __init__(self, max_size:int):
+        self.max_size = max_size
+        self.dropped = 0
+        self._buffer = bytearray()
+
+    def write(self, data:bytes) -> int:
+        buffer = self._buffer
+        buffer += data
+        excess = len(buffer) - self.max_size
+        if excess > 0:
+            # Deleting from the start does not move the rest
+            del buffer[:excess]
+            self.dropped += excess
+        return len(data)
+
+    def result(self) -> TailOutput:
+        output = TailOutput(self._buffer)
+        output.dropped = self.dropped
+        return output
+
+class Tail(Spool):
+    """Capture only the last max_size bytes of the output
+
+    Useful for stderr of chatty programs: errors show the
+    end of it. The result is a TailOutput (bytes)."""
+
+    def __init__(self, max_size:int=64 * 2**10):
+        super().__init__(max_size=max_size)
+
+    def create(self) -> _TailSink:
+        return _TailSink(self.max_size)
+
+# Outputs that are not decoded (can be large)
+_LARGE_OUTPUTS = (SpooledOutput, MappedOutput)
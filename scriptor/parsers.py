@@ -0,0 +1,168 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+from copy import copy
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional
+
+class StreamParser(ABC):
+    """Parser of streamed output to records
+
+    The output is fed in chunks (bytes) to ``feed`` which
+    returns the records completed by the chunk; ``close``
+    returns the rest. Set as ``stream_parser`` of a program
+    to get the records from ``iter`` and ``iter_async``."""
+
+    # Most bytes to read at a time (the output available
+    # is fed without waiting for a full chunk)
+    chunk_size:int = 65536
+
+    def create(self) -> 'StreamParser':
+        "Get a parser for a new stream"
+        return copy(self)
+
+    @abstractmethod
+    def feed(self, data:bytes) -> List[Any]:
+        "Get the records completed by the data"
+
+    def close(self) -> List[Any]:
+        return []
+
+    def parse(self, chunks:Iterable[bytes]) -> Iterator[Any]:
+        "Parse an iterable of chunks (ie. from run_process_iter)"
+        parser = self.create()
+        for data in chunks:
+            yield from parser.feed(data)
+        yield from parser.close()
+
+    async def parse_async(self, chunks:AsyncIterable[bytes]) -> AsyncIterator[Any]:
+        "Parse an async iterable of chunks"
+        parser = self.create()
+        async for data in chunks:
+            for record in parser.feed(data):
+                yield record
+        for record in parser.close():
+            yield record
+
+class Delimited(StreamParser):
+    """Records separated by a delimiter, ie. NUL from
+    ``find -print0`` or ``git ls-files -z``
+
+    The records are decoded with the encoding (bytes
+    if None). An empty record at the end is dropped."""
+
+    def __init__(self, sep:bytes=b'\0', encoding:Optional[str]='utf-8', errors:str='strict'):
+        self.sep = sep
+        self.encoding = encoding
+        self.errors = errors
+        self._chunks = []
+
+    def create(self) -> 'Delimited':
+        parser = copy(self)
+        parser._chunks = []
+        return parser
+
+    def feed(self, data:bytes) -> List[Any]:
+        self._chunks.append(data)
+        if self.sep not in data:
+            # Joined only when a record ends (a long
+            # record is not copied on each chunk)
+            return []
+        *records, rest = b''.join(self._chunks).split(self.sep)
+        self._chunks = [rest] if rest else []
+        return self._parse_records(records)
+
+    def close(self) -> List[Any]:
+        rest = b''.join(self._chunks)
+        self._chunks = []
+        return self._parse_records([rest] if rest else [])
+
+    def _parse_records(self, records:List[bytes]) -> List[Any]:
+        return [self.parse_record(record) for record in records]
+
+    def parse_record(self, record:bytes) -> Any:
+        if self.encoding is None:
+            return record
+        return record.decode(self.encoding, self.errors)
+
+class NDJSON(Delimited):
+    "Newline delimited JSON (a JSON value per line)"
+
+    def __init__(self, encoding:str='utf-8', errors:str='strict'):
+        super().__init__(b'\n', encoding=encoding, errors=errors)
+
+    def _parse_records(self, records:List[bytes]) -> List[Any]:
+        # Blank lines are skipped
+        return [self.parse_record(record) for record in records if record.strip()]
+
+    def parse_record(self, record:bytes) -> Any:
+        return json.loads(super().parse_record(record))
+
+class CSV(Delimited):
+    """Comma separated values
+
+    The rows are lists of strings, or dicts if header is
+    true (the first row has the field names). Quoted fields
+    can span lines."""
+
+    def __init__(self, delimiter:str=',', header:bool=False, encoding:str='utf-8', errors:str='strict', **fmtparams):
+        super().__init__(b'\n', encoding=encoding, errors=errors)
+        self.delimiter = delimiter
+        self.header = header
+        self.fmtparams = fmtparams
+        self._pending = []
+        self._quotes = 0
+        self._fields = None
+
+    def create(self) -> 'CSV':
+        parser = super().create()
+        parser._pending = []
+        parser._quotes = 0
+        parser._fields = None
+        return parser
+
+    def close(self) -> List[Any]:
+        rows = super().close()
+        if self._pending:
+            # Unclosed quote, left to csv to handle
+            self._add_row(rows, b'\n'.join(self._pending))
+            self._pending = []
+            self._quotes = 0
+        return rows
+
+    def _parse_records(self, records:List[bytes]) -> List[Any]:
+        rows = []
+        quote = self.fmtparams.get('quotechar', '"').encode(self.encoding)
+        for record in records:
+            quotes = record.count(quote)
+            if self._pending or quotes % 2:
+                # A quoted field continues on the next line
+                # (the lines are joined once it is closed)
+                self._pending.append(record)
+                self._quotes += quotes
+                if self._quotes % 2:
+                    continue
+                record = b'\n'.join(self._pending)
+                self._pending = []
+                self._quotes = 0
+            if record.strip():
+                self._add_row(rows, record)
+        return rows
+
+    def _add_row(self, rows:list, record:bytes):
+        row = self.parse_record(record)
+        if not self.header:
+            rows.append(row)
+        elif self._fields is None:
+            self._fields = row
+        else:
+            rows.append(dict(zip(self._fields, row)))
+
+    def parse_record(self, record:bytes) -> List[str]:
+        line = super().parse_record(record)
+        return next(csv.reader([line], delimiter=self.delimiter, **self.fmtparams))
+
+class TSV(CSV):
+    "Tab separated values"
+
+    def __init__(self, header:bool=False, encoding:str='utf-8', errors:str='strict', **fmtparams):
+        super().__init__('\t', header=header, encoding=encoding, errors=errors, **fmtparams)
@@ -0,0 +1,245 @@
+import os
+import signal
+import asyncio
+import threading
+import subprocess
+from typing import Any, List, Tuple
+
+from .process import ProcessError, _read_streams, _read_async
+from .runner import _open_files
+
+class PipelineError(ProcessError):
+    "One or more stages of a pipeline failed"
+
+    def __init__(self, errors:List[Tuple[int, ProcessError]]):
+        self.errors = errors
+        _, last = errors[-1]
+        super().__init__(
+            returncode=last.returncode,
+            cmd=last.cmd,
+            output=last._raw['output'],
+            stderr=last._raw['stderr'],
+        )
+
+    def __str__(self):
+        return "\n".join(
+            f"Stage {i} ({' '.join(exc.cmd)}) failed with exit code {exc.returncode}:\n{exc.stderr}"
+            for i, exc in self.errors
+        )
+
+class Pipeline:
+    """Programs whose stdout is connected to the
+    stdin of the next program with OS pipes
+
+    The data between the stages does not pass
+    through Python. Create pipelines with ``|``:
+
+    .. code-block:: python
+
+        >>> pipeline = Program("git", "log") | Program("grep", "fix")
+        >>> pipeline()
+
+    The arguments of the call are passed to the
+    first stage and the output is parsed by the
+    last stage. The timeout is for the whole pipeline
+    (the smallest timeout of the stages if not given)."""
+
+    def __init__(self, *programs, timeout=None):
+        self.programs = []
+        for program in programs:
+            if isinstance(program, Pipeline):
+                self.programs += program.programs
+            else:
+                self.programs.append(program)
+        if len(self.programs) < 2:
+            raise ValueError("Pipeline requires at least two programs")
+        if timeout is None:
+            timeouts = [program.timeout for program in programs if program.timeout is not None]
+            timeout = min(timeouts, default=None)
+        self.timeout = timeout
+
+    def __or__(self, other) -> 'Pipeline':
+        return Pipeline(self, other)
+
+    def pipe(self, other) -> 'Pipeline':
+        return self | other
+
+    def __call__(self, *args, **kwargs):
+        "Run the pipeline"
+        cmds, stdin = self.get_commands(*args, **kwargs)
+        with _open_files(stdin, {}) as (stdin, stdio):
+            procs = self._start(cmds, stdin, stdio)
+        timed_out = threading.Event()
+        def on_timeout():
+            timed_out.set()
+            _kill(procs)
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, on_timeout)
+            timer.start()
+        try:
+            if stdin is not None:
+                # Written in a thread so a large input
+                # does not block reading the output
+                procs[0].write_stream(stdin)
+            outputs = _read_streams(procs[-1].stdout, *(proc.stderr for proc in procs), sinks=_get_sinks(procs))
+            for proc in procs:
+                proc.wait()
+            if procs[0]._writer is not None:
+                procs[0]._writer.join()
+        except BaseException:
+            _kill(procs)
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmds, self.timeout)
+        stdout = self._check(cmds, [proc.returncode for proc in procs], outputs)
+        if not self.programs[-1].captures_output:
+            return None
+        return self.programs[-1].parse_output(stdout)
+
+    async def call_async(self, *args, **kwargs):
+        "Run the pipeline async"
+        cmds, stdin = self.get_commands(*args, **kwargs)
+        with _open_files(stdin, {}) as (stdin, stdio):
+            procs = await self._start_async(cmds, stdin, stdio)
+        try:
+            if stdin is not None:
+                procs[0].write(stdin)
+            outputs = await asyncio.wait_for(self._finish_async(procs), timeout=self.timeout)
+            if procs[0]._writer is not None:
+                await procs[0]._writer
+        except BaseException:
+            _kill(procs)
+            for proc in procs:
+                await proc.wait()
+            raise
+        stdout = self._check(cmds, [proc.returncode for proc in procs], outputs)
+        if not self.programs[-1].captures_output:
+            return None
+        return await self.programs[-1].parse_output_async(stdout)
+
+    def get_commands(self, *args, **kwargs) -> Tuple[List[List[str]], bytes]:
+        "Get the commands of the stages and the stdin of the first stage"
+        first, *others = self.programs
+        cmd, stdin = first.get_command(*args, **kwargs)
+        cmds = [cmd]
+        for program in others:
+            cmd, other_stdin = program.get_command()
+            if other_stdin is not None:
+                raise ValueError("Only the first stage of a pipeline can have input")
+            cmds.append(cmd)
+        return cmds, stdin
+
+    def _iter_stdio(self, cmds, stdin, stdio):
+        "Create the pipes between the stages"
+        read_fd = subprocess.PIPE if stdin is not None else None
+        if 'stdin' in stdio:
+            # A file handed over to the first stage
+            read_fd = os.dup(stdio['stdin'])
+        for i, (cmd, program) in enumerate(zip(cmds, self.programs)):
+            is_last = i == len(cmds) - 1
+            if is_last:
+                # Routed by the runner (ie. to a file)
+                write_fd = subprocess.PIPE if program.stdout is None else program.stdout
+                if isinstance(write_fd, int) and write_fd >= 0:
+                    write_fd = os.dup(write_fd)
+                next_read_fd = None
+            else:
+                next_read_fd, write_fd = os.pipe()
+            try:
+                yield cmd, program, read_fd, write_fd
+            except GeneratorExit:
+                _close_fds(next_read_fd)
+                raise
+            finally:
+                # The child has the ends now
+                _close_fds(read_fd, write_fd)
+            read_fd = next_read_fd
+
+    def _start(self, cmds, stdin, stdio) -> list:
+        procs = []
+        stdio = self._iter_stdio(cmds, stdin, stdio)
+        try:
+            for cmd, program, read_fd, write_fd in stdio:
+                procs.append(program.get_runner().start_program(cmd, stdin=read_fd, stdout=write_fd, **_get_kwargs(program)))
+        except BaseException:
+            stdio.close()
+            _kill(procs)
+            raise
+        return procs
+
+    async def _start_async(self, cmds, stdin, stdio) -> list:
+        procs = []
+        stdio = self._iter_stdio(cmds, stdin, stdio)
+        try:
+            for cmd, program, read_fd, write_fd in stdio:
+                procs.append(await program.get_runner().start_program_async(cmd, stdin=read_fd, stdout=write_fd, **_get_kwargs(program)))
+        except BaseException:
+            stdio.close()
+            _kill(procs)
+            raise
+        return procs
+
+    async def _finish_async(self, procs) -> List[bytes]:
+        outputs = await asyncio.gather(
+            _read_async(procs[-1].stdout, procs[-1]._sinks.get('stdout')),
+            *(_read_async(proc.stderr, proc._sinks.get('stderr')) for proc in procs)
+        )
+        for proc in procs:
+            await proc.wait()
+        return outputs
+
+    def _check(self, cmds, returncodes, outputs) -> Any:
+        "Raise if a stage failed, otherwise return the stdout"
+        stdout, *stderrs = outputs
+        errors = []
+        # Not on Windows
+        sigpipe = getattr(signal, 'SIGPIPE', None)
+        for i, (cmd, returncode, stderr) in enumerate(zip(cmds, returncodes, stderrs)):
+            is_last = i == len(cmds) - 1
+            if not is_last and sigpipe is not None and returncode == -sigpipe:
+                # A later stage stopped reading (ie. head)
+                continue
+            if returncode:
+                errors.append((i, ProcessError(
+                    returncode=returncode,
+                    cmd=cmd,
+                    output=stdout if is_last else None,
+                    stderr=stderr,
+                )))
+        if errors:
+            raise PipelineError(errors)
+        return stdout
+
+def _get_sinks(procs) -> dict:
+    "Get the sinks of the stdout of the last stage and the stderrs by stream index"
+    sinks = procs[-1]._get_sinks('stdout')
+    for i, proc in enumerate(procs, start=1):
+        if 'stderr' in proc._sinks:
+            sinks[i] = proc._sinks['stderr']
+    return sinks
+
+def _get_kwargs(program) -> dict:
+    kwargs = dict(cwd=program.cwd)
+    if program.stderr is not None:
+        kwargs['stderr'] = program.stderr
+    if program.env is not None:
+        kwargs['env'] = program.env
+    return kwargs
+
+def _close_fds(*fds):
+    for fd in fds:
+        # Skip subprocess.PIPE and None
+        if isinstance(fd, int) and fd >= 0:
+            os.close(fd)
+
+def _kill(procs):
+    for proc in procs:
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
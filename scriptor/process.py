@@ -1,14 +1,28 @@
+import os
 import asyncio
 from re import S
 import subprocess
+import selectors
+import threading
 from abc import abstractmethod
-from typing import Any, Union
-from .utils import to_string, to_bytes
+from functools import partial
+from typing import IO, Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple, Union
+from .output import Spool
+from .utils import to_string, to_bytes, iter_bytes, aiter_bytes, get_fileno, copy_fd
+
+try:
+    from typing import Literal
+except ImportError: # pragma: no cover
+    from typing_extensions import Literal
+
+_PIPE_CHUNK_SIZE = 32768
 
 def _raise_for_error(returncode, cmd, stdout, stderr):
     if returncode:
-        stdout = to_string(stdout)
-        stderr = to_string(stderr)
+        # Not captured if routed elsewhere
+        # (decoded by the error when needed)
+        stdout = b'' if stdout is None else stdout
+        stderr = b'' if stderr is None else stderr
         raise ProcessError(
             returncode=returncode, 
             cmd=cmd,
@@ -16,10 +30,203 @@ def _raise_for_error(returncode, cmd, stdout, stderr):
             stderr=stderr,
         )
 
+def _read_streams(*streams, sinks:Dict[int, IO]=None) -> List[bytes]:
+    """Read the streams to EOF simultaneously (None streams give empty bytes)
+
+    Streams that have a sink (by index) are written to
+    the sink and its result is returned instead of the bytes."""
+    sinks = sinks or {}
+    output = _read_all(streams, sinks)
+    for i, sink in sinks.items():
+        output[i] = sink.result()
+    return output
+
+def _read_all(streams, sinks) -> list:
+    output = [b''] * len(streams)
+    opened = [(i, stream) for i, stream in enumerate(streams) if stream is not None]
+    if len(opened) == 1:
+        i, stream = opened[0]
+        output[i] = _read_stream(stream, sinks.get(i))
+        return output
+    if not hasattr(selectors, 'PollSelector') or not all(hasattr(stream, 'read1') for _, stream in opened):
+        # Windows pipes and text streams don't work with selectors
+        return _read_streams_threaded(opened, output, sinks)
+
+    chunks = {i: [] for i, _ in opened}
+    with selectors.DefaultSelector() as selector:
+        for i, stream in opened:
+            selector.register(stream, selectors.EVENT_READ, i)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = key.fileobj.read1(_PIPE_CHUNK_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                elif key.data in sinks:
+                    sinks[key.data].write(data)
+                else:
+                    chunks[key.data].append(data)
+    for i, parts in chunks.items():
+        if i not in sinks:
+            output[i] = b''.join(parts)
+    return output
+
+def _read_stream(stream, sink=None):
+    if sink is None:
+        return stream.read()
+    while True:
+        data = stream.read(_PIPE_CHUNK_SIZE)
+        if not data:
+            return sink
+        sink.write(data)
+
+def _read_streams_threaded(streams, output, sinks):
+    def read(i, stream):
+        output[i] = _read_stream(stream, sinks.get(i))
+    threads = [threading.Thread(target=read, args=(i, stream), daemon=True) for i, stream in streams]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return output
+
 class ProcessError(subprocess.CalledProcessError):
+    """Process returned non-zero exit code
+
+    The outputs are decoded only when accessed. If they
+    were captured with Tail, only the end of them are
+    kept and the counts of the dropped bytes are in
+    output_dropped and stderr_dropped."""
+
+    @property
+    def output(self):
+        return self._decode('output')
+
+    @output.setter
+    def output(self, value):
+        self._set_raw('output', value)
+
+    @property
+    def stderr(self):
+        return self._decode('stderr')
+
+    @stderr.setter
+    def stderr(self, value):
+        self._set_raw('stderr', value)
+
+    @property
+    def output_dropped(self) -> int:
+        return getattr(self._raw['output'], 'dropped', 0)
+
+    @property
+    def stderr_dropped(self) -> int:
+        return getattr(self._raw['stderr'], 'dropped', 0)
+
+    def _set_raw(self, name, value):
+        if '_raw' not in self.__dict__:
+            self._raw = {}
+            self._decoded = {}
+        self._raw[name] = value
+        self._decoded.pop(name, None)
+
+    def _decode(self, name):
+        if name not in self._decoded:
+            value = self._raw[name]
+            # Spooled and mapped outputs can be large
+            if isinstance(value, (bytes, bytearray)):
+                # A tail can start in the middle of a character
+                errors = 'replace' if getattr(value, 'dropped', 0) else 'strict'
+                value = to_string(value, errors=errors)
+            self._decoded[name] = value
+        return self._decoded[name]
 
     def __str__(self):
-        return self.stderr
+        stderr = self.stderr
+        if not stderr:
+            # The stderr was not captured (or is empty)
+            return super().__str__()
+        if self.stderr_dropped:
+            return f"[{self.stderr_dropped} bytes dropped]\n{stderr}"
+        return stderr
+
+class Tee:
+    """Write the output to a file (path, file descriptor
+    or file object) while capturing it"""
+
+    def __init__(self, target:Union[os.PathLike, int, IO]):
+        self.target = target
+
+    def open(self) -> Tuple[IO, bool]:
+        "Open the target as a binary file (and whether to close it after)"
+        if isinstance(self.target, os.PathLike):
+            return open(self.target, 'wb'), True
+        if isinstance(self.target, int):
+            return open(self.target, 'wb', closefd=False), True
+        return getattr(self.target, 'buffer', self.target), False
+
+class _TeeReader:
+    "Stream that copies what is read from it to a file"
+
+    def __init__(self, stream, tee:Tee):
+        self._stream = stream
+        self._file, self._close_file = tee.open()
+        if hasattr(stream, 'read1'):
+            # Text streams don't have it
+            self.read1 = lambda *args: self._copy(stream.read1(*args))
+
+    def _copy(self, data):
+        if data:
+            self._file.write(data.encode() if isinstance(data, str) else data)
+        else:
+            self._finish()
+        return data
+
+    def _finish(self):
+        if self._close_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def read(self, size=-1):
+        data = self._copy(self._stream.read(size))
+        if size is None or size < 0:
+            # Read to EOF
+            self._finish()
+        return data
+
+    def readline(self, *args):
+        return self._copy(self._stream.readline(*args))
+
+    def readinto(self, buffer):
+        size = self._stream.readinto(buffer)
+        self._copy(memoryview(buffer)[:size])
+        return size
+
+    def close(self):
+        self._stream.close()
+        self._finish()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class _AsyncTeeReader(_TeeReader):
+    "asyncio stream that copies what is read from it to a file"
+
+    async def read(self, size=-1):
+        data = self._copy(await self._stream.read(size))
+        if size < 0:
+            self._finish()
+        return data
+
+    async def readline(self):
+        return self._copy(await self._stream.readline())
+
+    async def readexactly(self, size):
+        try:
+            return self._copy(await self._stream.readexactly(size))
+        except asyncio.IncompleteReadError as exc:
+            self._copy(exc.partial)
+            self._finish()
+            raise
 
 class BaseProcess:
     _stdout: bytes
@@ -34,14 +241,41 @@ class BaseProcess:
 
         self._stdout = None
         self._stderr = None
+        self._writer = None
+        self._write_error = None
+        # Where the output streams are read to (instead of bytes)
+        self._sinks = {}
 
     def write(self, s):
+        """Write to stdin and close it
+
+        Bytes and strings are written at once, other sources
+        (paths, file objects and iterables) are streamed in
+        the background."""
         parser = self.input_parser
         if parser is not None:
             s = parser(s)
+        if not isinstance(s, (bytes, str)):
+            self.write_stream(s)
+            return
         self._proc.stdin.write(to_bytes(s))
         self._proc.stdin.close()
 
+    def tee(self, **tees:Tee):
+        "Copy the output streams (stdout and/or stderr) to files while reading them"
+        for name, tee in tees.items():
+            stream = getattr(self._proc, name)
+            setattr(self._proc, name, self._tee_reader(stream, tee))
+
+    def spool(self, **spools:Spool):
+        "Capture the output streams (stdout and/or stderr) to spooled files"
+        for name, spool in spools.items():
+            self._sinks[name] = spool.create()
+
+    def _get_sinks(self, *names) -> dict:
+        "Get the sinks of the given streams by their index"
+        return {i: self._sinks[name] for i, name in enumerate(names) if name in self._sinks}
+
     def _parse_output(self, s):
         parser = self.output_parser
         if parser is None:
@@ -87,6 +321,7 @@ class BaseProcess:
         return repr(self._proc)
 
 class Process(BaseProcess):
+    _tee_reader = _TeeReader
     _proc: subprocess.Popen
 
     @property
@@ -94,8 +329,74 @@ class Process(BaseProcess):
         self._proc.poll()
         return self._proc.returncode
 
-    def wait(self):
-        return self._proc.wait()
+    def wait(self, timeout=None):
+        return self._proc.wait(timeout=timeout)
+
+    def finish(self, timeout=None):
+        "Read the outputs and wait for the process to finish"
+        timer = None
+        timed_out = threading.Event()
+        if timeout is not None:
+            def kill():
+                timed_out.set()
+                self._proc.kill()
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+        try:
+            self._drain()
+            returncode = self._proc.wait()
+            if self._writer is not None:
+                self._writer.join()
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(self.cmd, timeout)
+        if self._write_error is not None:
+            # Reading the source failed
+            raise self._write_error
+        return returncode
+
+    def write_stream(self, source):
+        """Write the source (bytes, path, file object or an
+        iterable) to stdin in a thread and close stdin"""
+        self._write_error = None
+        self._writer = threading.Thread(target=self._write_chunks, args=(source,), daemon=True)
+        self._writer.start()
+
+    def _write_chunks(self, source):
+        if self._proc.stdin is None:
+            # The stdin was handed over
+            return
+        # The chunks are bytes even if stdin is in text mode
+        stdin = getattr(self._proc.stdin, 'buffer', self._proc.stdin)
+        try:
+            fileno = get_fileno(source)
+            if isinstance(source, os.PathLike):
+                with open(source, 'rb') as file:
+                    copy_fd(file.fileno(), stdin.fileno())
+            elif fileno is not None:
+                # Copied in the kernel if possible
+                copy_fd(fileno, stdin.fileno())
+            else:
+                # The pipe blocks the thread when full (backpressure)
+                for chunk in iter_bytes(source):
+                    stdin.write(chunk)
+        except BrokenPipeError:
+            # The process stopped reading
+            pass
+        except ValueError as exc:
+            # The stdin was closed if the process was
+            # killed, otherwise reading the source failed
+            if not stdin.closed:
+                self._write_error = exc
+        except Exception as exc:
+            self._write_error = exc
+        finally:
+            try:
+                stdin.close()
+            except (BrokenPipeError, ValueError):
+                pass
 
     def communicate(self, *args, **kwargs):
         stdout, stderr = self._proc.communicate(*args, **kwargs)
@@ -103,6 +404,67 @@ class Process(BaseProcess):
         self._stderr = stderr
         return stdout, stderr
 
+    def __iter__(self) -> Iterator[bytes]:
+        "Iterate the lines of stdout (raises ProcessError at the end if failed)"
+        return self.iter_output()
+
+    def iter_output(self, chunk:Union[Literal['line'], int]='line', partial_chunks:bool=False) -> Iterator[bytes]:
+        """Iterate stdout by lines or by chunks of given size
+        (raises ProcessError at the end if failed)
+
+        With partial_chunks, a chunk is the output available
+        (at most the size) instead of waiting for the full size.
+        The process is killed if the iteration is closed early."""
+        stream = self._proc.stdout
+        if chunk == 'line':
+            return self._iter_stream(stream.readline)
+        if partial_chunks:
+            return self._iter_stream(partial(stream.read1, chunk))
+        return self._iter_stream(partial(stream.read, chunk))
+
+    def iter_into(self, buffer:Union[bytearray, memoryview]) -> Iterator[memoryview]:
+        """Iterate stdout by filling the given buffer
+        (raises ProcessError at the end if failed)
+
+        Yields a memoryview of the filled part of the buffer
+        which is valid until the next iteration. No new
+        buffers are allocated for the chunks."""
+        view = memoryview(buffer).cast('B')
+        stream = self._proc.stdout
+        def read():
+            size = stream.readinto(view)
+            return view if size == len(view) else view[:size]
+        return self._iter_stream(read)
+
+    def _iter_stream(self, read:Callable[[], bytes]) -> Iterator[bytes]:
+        # The stderr is read in a thread
+        # so the process does not block on it
+        stderr_thread = None
+        if self._stderr is None and self._proc.stderr is not None:
+            stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+            stderr_thread.start()
+        finished = False
+        try:
+            while True:
+                data = read()
+                if not data:
+                    break
+                yield data
+            self._stdout = b''
+            self._proc.wait()
+            finished = True
+        finally:
+            if not finished and self._proc.poll() is None:
+                # Consumer stopped early (or failure)
+                self._proc.kill()
+                self._proc.wait()
+            if stderr_thread is not None:
+                stderr_thread.join()
+        _raise_for_error(self._proc.returncode, cmd=self.cmd, stdout=self._stdout, stderr=self._stderr)
+
+    def _read_stderr(self):
+        self._stderr = _read_streams(self._proc.stderr, sinks=self._get_sinks('stderr'))[0]
+
     def read(self):
         stdout = self.get_stdout()
         return self._parse_output(stdout)
@@ -116,22 +478,30 @@ class Process(BaseProcess):
         )
 
     def get_stdout(self):
-        stream = self._proc.stdout
-        consumed = self._stdout is not None
-        if not consumed:
-            self._stdout = stream.read()
+        if self._stdout is None:
+            self._drain()
         return self._stdout
 
     def get_stderr(self):
-        stream = self._proc.stderr
-        consumed = self._stderr is not None
-        if not consumed:
-            self._stderr = stream.read()
+        if self._stderr is None:
+            self._drain()
         return self._stderr
 
+    def _drain(self):
+        "Read the unconsumed stdout and stderr simultaneously"
+        stdout = self._proc.stdout if self._stdout is None else None
+        stderr = self._proc.stderr if self._stderr is None else None
+        sinks = self._get_sinks('stdout' if stdout is not None else None, 'stderr' if stderr is not None else None)
+        out, err = _read_streams(stdout, stderr, sinks=sinks)
+        if self._stdout is None:
+            self._stdout = out
+        if self._stderr is None:
+            self._stderr = err
+
 
 class AsyncProcess(BaseProcess):
     _proc: asyncio.subprocess.Process
+    _tee_reader = _AsyncTeeReader
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -139,6 +509,73 @@ class AsyncProcess(BaseProcess):
     async def wait(self):
         return await self._proc.wait()
 
+    async def finish(self):
+        "Read the outputs and wait for the process to finish"
+        await self._drain()
+        returncode = await self._proc.wait()
+        if self._writer is not None:
+            await self._writer
+        return returncode
+
+    def write_stream(self, source):
+        """Write the source (bytes, path, file object or an
+        (async) iterable) to stdin in a task and close stdin"""
+        self._writer = asyncio.ensure_future(self._write_chunks(source))
+
+    async def _write_chunks(self, source):
+        stdin = self._proc.stdin
+        try:
+            async for chunk in aiter_bytes(source):
+                stdin.write(chunk)
+                # Wait for the process to consume (backpressure)
+                await stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The process stopped reading or was killed
+            pass
+        finally:
+            stdin.close()
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        "Iterate the lines of stdout (raises ProcessError at the end if failed)"
+        return self.iter_output()
+
+    async def iter_output(self, chunk:Union[Literal['line'], int]='line', partial_chunks:bool=False) -> AsyncIterator[bytes]:
+        """Iterate stdout by lines or by chunks of given size
+        (raises ProcessError at the end if failed)
+
+        With partial_chunks, a chunk is the output available
+        (at most the size) instead of waiting for the full size.
+        The process is killed if the iteration is closed early."""
+        # The stderr is read in the background
+        # so the process does not block on it
+        stderr_task = None
+        if self._stderr is None:
+            stderr_task = asyncio.ensure_future(_read_async(self._proc.stderr, self._sinks.get('stderr')))
+        if chunk == 'line':
+            output = _iter_lines_async(self._proc.stdout)
+        elif partial_chunks:
+            output = _iter_partial_chunks_async(self._proc.stdout, chunk)
+        else:
+            output = _iter_chunks_async(self._proc.stdout, chunk)
+        finished = False
+        try:
+            async for data in output:
+                yield data
+            self._stdout = b''
+            if stderr_task is not None:
+                self._stderr = await stderr_task
+            await self._proc.wait()
+            finished = True
+        finally:
+            if not finished:
+                # Consumer stopped early (or failure)
+                if stderr_task is not None:
+                    stderr_task.cancel()
+                if self._proc.returncode is None:
+                    self._proc.kill()
+                    await self._proc.wait()
+        _raise_for_error(self._proc.returncode, cmd=self.cmd, stdout=self._stdout, stderr=self._stderr)
+
     async def communicate(self, *args, **kwargs):
         stdout, stderr = await self._proc.communicate(*args, **kwargs)
         self._stdout = stdout
@@ -158,15 +595,71 @@ class AsyncProcess(BaseProcess):
         )
 
     async def get_stdout(self):
-        stream = self._proc.stdout
-        consumed = self._stdout is not None
-        if not consumed:
-            self._stdout = await stream.read()
+        if self._stdout is None:
+            await self._drain()
         return self._stdout
 
     async def get_stderr(self):
-        stream = self._proc.stderr
-        consumed = self._stderr is not None
-        if not consumed:
-            self._stderr = await stream.read()
+        if self._stderr is None:
+            await self._drain()
         return self._stderr
+
+    async def _drain(self):
+        "Read the unconsumed stdout and stderr concurrently"
+        stdout = self._proc.stdout if self._stdout is None else None
+        stderr = self._proc.stderr if self._stderr is None else None
+        out, err = await asyncio.gather(
+            _read_async(stdout, self._sinks.get('stdout') if stdout is not None else None),
+            _read_async(stderr, self._sinks.get('stderr') if stderr is not None else None),
+        )
+        if self._stdout is None:
+            self._stdout = out
+        if self._stderr is None:
+            self._stderr = err
+
+async def _iter_lines_async(stream) -> AsyncIterator[bytes]:
+    "Iterate lines from a stream (lines can exceed the stream's limit)"
+    buffer = bytearray()
+    while True:
+        chunk = await stream.read(_PIPE_CHUNK_SIZE)
+        if not chunk:
+            break
+        start = len(buffer)
+        buffer += chunk
+        while True:
+            pos = buffer.find(b'\n', start)
+            if pos == -1:
+                break
+            yield bytes(buffer[:pos + 1])
+            del buffer[:pos + 1]
+            start = 0
+    if buffer:
+        yield bytes(buffer)
+
+async def _iter_chunks_async(stream, size:int) -> AsyncIterator[bytes]:
+    "Iterate fixed size chunks from a stream (the last may be shorter)"
+    while True:
+        try:
+            yield await stream.readexactly(size)
+        except asyncio.IncompleteReadError as exc:
+            if exc.partial:
+                yield exc.partial
+            break
+
+async def _iter_partial_chunks_async(stream, size:int) -> AsyncIterator[bytes]:
+    "Iterate the data available in a stream (at most size at a time)"
+    while True:
+        data = await stream.read(size)
+        if not data:
+            break
+        yield data
+
+async def _read_async(stream, sink=None) -> bytes:
+    if sink is None:
+        return b'' if stream is None else await stream.read()
+    while stream is not None:
+        data = await stream.read(_PIPE_CHUNK_SIZE)
+        if not data:
+            break
+        sink.write(data)
+    return sink.result()
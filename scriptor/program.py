@@ -1,31 +1,184 @@
 
+import os
+import asyncio
 import subprocess
+from collections import deque
+from concurrent import futures
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from io import BytesIO, StringIO
 from copy import copy
-from typing import Callable, Iterable, Tuple, Union, ByteString
+from itertools import islice
+from typing import IO, AsyncIterable, Callable, Iterable, Iterator, AsyncIterator, Tuple, Union, ByteString
 from typing import Any, Dict, List
-from .runner import run_process_sync, run_process_async, run_process_iter, start_process, start_process_async
-from .utils import to_bytes, to_string
+from .runner import Runner, get_runner
+from .pipeline import Pipeline
+from .process import Tee
+from .output import MappedOutput, Spool, Tail, _LARGE_OUTPUTS
+from .parsers import StreamParser
+from .cache import Cache, make_key, is_bypassed
+from .flight import FLIGHTS
+from .utils import Decoder, NewlinePolicy, to_bytes, to_string, iter_bytes, aiter_bytes, get_fileno
 
 try:
     from typing import Literal
 except ImportError: # pragma: no cover
     from typing_extensions import Literal
 
+# Shared by the programs that parse in processes
+_process_pool = None
+
+def _get_parse_executor(executor, output) -> Union[Executor, None]:
+    "Get the executor for parsing (None for the loop's default)"
+    global _process_pool
+    if executor == 'process' and not isinstance(output, _LARGE_OUTPUTS):
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor()
+        return _process_pool
+    if executor in ('thread', 'process'):
+        # Large outputs are files that cannot be sent to processes
+        return None
+    return executor
+
+def _parse_output(output, output_type, output_parser, encoding, errors, newline):
+    "Parse the output (a function so it can be sent to other processes)"
+    if isinstance(output, _LARGE_OUTPUTS):
+        # Left to the parser (or the caller) to read
+        if output_parser is None:
+            return output
+        if isinstance(output, MappedOutput):
+            # As a buffer (memoryview) without copying
+            return output_parser(output.view)
+        return output_parser(output)
+    if output_type in ('str', str):
+        output = to_string(output, encoding=encoding or 'utf-8', errors=errors, newline=newline)
+    elif output_type in ('bytes', bytes):
+        output = to_bytes(output)
+
+    if output_parser is None:
+        if output in ('', b''):
+            return None
+        return output
+    return output_parser(output)
+
+def _as_args(item) -> tuple:
+    return item if isinstance(item, tuple) else (item,)
+
+def _pop_finished(pending:deque, done:set, ordered:bool):
+    "Pop the finished futures (in submission order if ordered)"
+    if ordered:
+        while pending and pending[0].done():
+            yield pending.popleft()
+    else:
+        for fut in [fut for fut in pending if fut in done]:
+            pending.remove(fut)
+            yield fut
+
+def _get_result(fut, return_exceptions=False):
+    if return_exceptions:
+        exc = fut.exception()
+        if exc is not None:
+            return exc
+    return fut.result()
+
+class _StreamDecoder:
+    "Decode and parse streamed output one line or chunk at a time"
+
+    def __init__(self, program:'BaseProgram', chunk:Union[str, int]='line'):
+        self.as_text = program.output_type in ('str', str)
+        self.by_line = chunk == 'line'
+        self.parser = program.output_parser
+        self.decoder = Decoder(program.encoding or 'utf-8', program.errors, program.newline)
+
+    def feed(self, data:bytes) -> list:
+        if self.as_text:
+            if self.by_line:
+                data = self.decoder.decode_line(data)
+            else:
+                data = self.decoder.decode(data)
+            if not data and not self.by_line:
+                # Only part of a character
+                return []
+        return [self._parse(data)]
+
+    def close(self) -> list:
+        if self.as_text:
+            data = self.decoder.decode(b'', final=True)
+            if data:
+                return [self._parse(data)]
+        return []
+
+    def _parse(self, data):
+        if self.parser is None:
+            return data
+        return self.parser(data)
+
 class Input:
-    "Stdin for a program"
-    def __init__(self, data:Union[str, bytes]):
+    """Stdin for a program
+
+    The data can be bytes or a string, or a source that
+    is streamed to the process: a path, a file object or
+    an (async) iterable of bytes or strings."""
+    def __init__(self, data:Union[str, bytes, os.PathLike, IO, Iterable, AsyncIterable], chunk_size:int=65536):
         self.data = data
+        self.chunk_size = chunk_size
 
-    def read(self):
+    @property
+    def is_stream(self) -> bool:
+        return not isinstance(self.data, (str, bytes))
+
+    @property
+    def is_file(self) -> bool:
+        "Whether the data is a path or a file with a file descriptor"
+        return isinstance(self.data, os.PathLike) or get_fileno(self.data) is not None
+
+    def read(self) -> bytes:
+        if self.is_stream:
+            return b''.join(self)
         return to_bytes(self.data)
 
+    def __iter__(self) -> Iterator[bytes]:
+        return iter_bytes(self.data, self.chunk_size)
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return aiter_bytes(self.data, self.chunk_size)
+
 class BaseProgram:
     "Inheritable program class"
 
     program:Union[str, Iterable[str]] = None
     output_type:Literal['str', 'bytes'] = 'str'
     output_parser = None
+    # Where the outputs go: 'capture' (None), 'discard', 'inherit',
+    # a path, file descriptor or file object, Tee(...), Spool(...) or Mapped()
+    stdout:Union[Literal['capture', 'discard', 'inherit'], os.PathLike, IO, int, Tee, Spool] = None
+    stderr:Union[Literal['capture', 'discard', 'inherit'], os.PathLike, IO, int, Tee, Tail] = None
+    # How the output is decoded (see scriptor.utils.Decoder)
+    newline:NewlinePolicy = 'strip-trailing'
+    errors:str = 'strict'
+    # Where call_async parses outputs of parse_threshold
+    # bytes or more (None for in the event loop)
+    parse_executor:Union[Literal['thread', 'process'], Executor, None] = None
+    parse_threshold:int = 2**20
+    # Parses iterated output to records (see scriptor.parsers)
+    stream_parser:StreamParser = None
+    # Environment variables of the process (os.environ if None)
+    env:Dict[str, str] = None
+    # Cache of the outputs (see scriptor.cache)
+    cache:Cache = None
+    # Files (paths or globs) that the output depends on and
+    # how they are compared in the cache (besides the files
+    # in the arguments)
+    input_files:Iterable[str] = ()
+    file_fingerprint:Literal['stat', 'hash'] = 'stat'
+    # Whether identical concurrent calls share one process
+    single_flight:bool = False
+    # Scheduling of the runs if the runner has a scheduler
+    # (see scriptor.scheduler, the group is the program name
+    # if None)
+    priority:Union[Literal['high', 'normal', 'low'], int] = None
+    group:str = None
+    # Runs the processes (the runner of the context if None)
+    runner:Runner = None
 
     default_kwargs = None
 
@@ -33,23 +186,152 @@ class BaseProgram:
     short_form = "-{}"
     long_form = "--{}"
 
-    def __init__(self, timeout=None, cwd=None, arg_form:Literal['short', '-', 'long', '--', None]=None, encoding=None):
+    def __init__(self, timeout=None, cwd=None, arg_form:Literal['short', '-', 'long', '--', None]=None, encoding=None, stdout=None, stderr=None, newline=None, errors=None, parse_executor=None, parse_threshold=None, stream_parser=None, env=None, cache=None, input_files=None, file_fingerprint=None, single_flight=None, priority=None, group=None, runner=None):
 
         self.timeout = timeout
         self.cwd = cwd
         self.arg_form = arg_form
         self.encoding = encoding
+        if stdout is not None:
+            self.stdout = stdout
+        if stderr is not None:
+            self.stderr = stderr
+        if newline is not None:
+            self.newline = newline
+        if errors is not None:
+            self.errors = errors
+        if parse_executor is not None:
+            self.parse_executor = parse_executor
+        if parse_threshold is not None:
+            self.parse_threshold = parse_threshold
+        if stream_parser is not None:
+            self.stream_parser = stream_parser
+        if env is not None:
+            self.env = env
+        if cache is not None:
+            self.cache = cache
+        if input_files is not None:
+            self.input_files = input_files
+        if file_fingerprint is not None:
+            self.file_fingerprint = file_fingerprint
+        if single_flight is not None:
+            self.single_flight = single_flight
+        if priority is not None:
+            self.priority = priority
+        if group is not None:
+            self.group = group
+        if runner is not None:
+            self.runner = runner
 
     def __call__(self, *args, **kwargs):
         "Run the program (with given parameters)"
         cmd, stdin = self.get_command(*args, **kwargs)
-        output = run_process_sync(cmd, input=stdin, **self.get_process_kwargs())
+        output = self._run(cmd, stdin)
+        if not self.captures_output:
+            return None
         return self.parse_output(output)
 
     async def call_async(self, *args, **kwargs):
         cmd, stdin = self.get_command(*args, **kwargs)
-        output = await run_process_async(cmd, input=stdin, **self.get_process_kwargs())
-        return self.parse_output(output)
+        output = await self._run_async(cmd, stdin)
+        if not self.captures_output:
+            return None
+        return await self.parse_output_async(output)
+
+    def _get_cache(self):
+        return self.cache if not is_bypassed() else None
+
+    def _run(self, cmd, stdin) -> bytes:
+        "Run the command through the cache and the single-flight (if set)"
+        cache = self._get_cache()
+        key = self.get_cache_key(cmd, stdin)
+        if key is not None and cache is not None:
+            output = cache.get(key)
+            if output is not None:
+                return output
+        def run():
+            output = self.get_runner().run_process_sync(cmd, input=stdin, **self.get_process_kwargs())
+            if key is not None and cache is not None:
+                cache.set(key, output)
+            return output
+        if key is not None and self.single_flight:
+            return FLIGHTS.run(key, run)
+        return run()
+
+    async def _run_async(self, cmd, stdin) -> bytes:
+        cache = self._get_cache()
+        key = self.get_cache_key(cmd, stdin)
+        if key is not None and cache is not None:
+            output = cache.get(key)
+            if output is not None:
+                return output
+        async def run():
+            output = await self.get_runner().run_process_async(cmd, input=stdin, **self.get_process_kwargs())
+            if key is not None and cache is not None:
+                cache.set(key, output)
+            return output
+        if key is not None and self.single_flight:
+            return await FLIGHTS.run_async(key, run)
+        return await run()
+
+    @property
+    def captures_output(self) -> bool:
+        "Whether the output is returned (instead of written elsewhere)"
+        return self.stdout in (None, 'capture') or isinstance(self.stdout, (Tee, Spool))
+
+    def map(self, iterable:Iterable, concurrency:int=None, ordered:bool=True, return_exceptions:bool=False, **kwargs) -> Iterator[Any]:
+        """Run the program for each item in the iterable
+        concurrently and yield the parsed outputs
+
+        An item that is a tuple is passed as positional
+        arguments, other items as the only positional
+        argument. Keyword arguments are passed to each run.
+        At most ``concurrency`` processes run at once."""
+        concurrency = concurrency or os.cpu_count() or 1
+        items = iter(iterable)
+        pending = deque()
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    for item in islice(items, concurrency - len(running)):
+                        fut = executor.submit(self, *_as_args(item), **kwargs)
+                        pending.append(fut)
+                        running.add(fut)
+                    if not pending:
+                        break
+                    done, running = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                    for fut in _pop_finished(pending, done, ordered):
+                        yield _get_result(fut, return_exceptions)
+            finally:
+                for fut in pending:
+                    fut.cancel()
+
+    async def map_async(self, iterable:Iterable, concurrency:int=None, ordered:bool=True, return_exceptions:bool=False, **kwargs) -> AsyncIterator[Any]:
+        """Run the program for each item in the iterable
+        concurrently and yield the parsed outputs (async)"""
+        concurrency = concurrency or os.cpu_count() or 1
+        items = iter(iterable)
+        pending = deque()
+        running = set()
+        try:
+            while True:
+                for item in islice(items, concurrency - len(running)):
+                    task = asyncio.ensure_future(self.call_async(*_as_args(item), **kwargs))
+                    pending.append(task)
+                    running.add(task)
+                if not pending:
+                    break
+                done = set()
+                if running:
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in _pop_finished(pending, done, ordered):
+                    yield _get_result(task, return_exceptions)
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
 
     def get_command(self, *args, **kwargs) -> Tuple[List[str], ByteString]:
         cmd_args, stdin_args = self.parse_args(args)
@@ -62,13 +344,100 @@ class BaseProgram:
             stdin = stdin_args or stdin_kwargs
         return cmd, stdin
 
-    def __iter__(self, *args, **kwargs):
+    def __iter__(self):
+        return self.iter()
+
+    def iter(self, *args, chunk:Union[Literal['line'], int, None]=None, **kwargs) -> Iterator[Any]:
+        """Run the program and iterate the output by lines
+        or by chunks of given size (in bytes)
+
+        The lines/chunks are decoded to the output_type
+        and parsed with the output_parser one at a time,
+        or to records with the stream_parser."""
+        cmd, stdin = self.get_command(*args, **kwargs)
+        decoder, chunk, partial_chunks = self._get_stream_decoder(chunk)
+        output = self.get_runner().run_process_iter(cmd, input=stdin, chunk=chunk, partial_chunks=partial_chunks, **self.get_process_kwargs())
+        try:
+            for data in output:
+                yield from decoder.feed(data)
+            yield from decoder.close()
+        finally:
+            output.close()
+
+    async def iter_async(self, *args, chunk:Union[Literal['line'], int, None]=None, **kwargs) -> AsyncIterator[Any]:
+        """Run the program and iterate the output by lines
+        or by chunks of given size (in bytes) async"""
+        cmd, stdin = self.get_command(*args, **kwargs)
+        decoder, chunk, partial_chunks = self._get_stream_decoder(chunk)
+        output = self.get_runner().run_process_iter_async(cmd, input=stdin, chunk=chunk, partial_chunks=partial_chunks, **self.get_process_kwargs())
+        try:
+            async for data in output:
+                for item in decoder.feed(data):
+                    yield item
+            for item in decoder.close():
+                yield item
+        finally:
+            await output.aclose()
+
+    def _get_stream_decoder(self, chunk) -> tuple:
+        if self.stream_parser is not None:
+            if chunk is None:
+                # The records are parsed as soon as the
+                # output comes (not when a chunk is full)
+                return self.stream_parser.create(), self.stream_parser.chunk_size, True
+            return self.stream_parser.create(), chunk, False
+        chunk = chunk or 'line'
+        return _StreamDecoder(self, chunk), chunk, False
+
+    def iter_into(self, buffer:Union[bytearray, memoryview], *args, **kwargs) -> Iterator[memoryview]:
+        """Run the program and iterate the raw output by
+        filling the given buffer
+
+        Yields memoryviews of the filled part of the buffer.
+        The view is overwritten on the next iteration."""
         cmd, stdin = self.get_command(*args, **kwargs)
-        return run_process_iter(cmd, stdin=stdin, **self.get_process_kwargs())
+        output = self.get_runner().run_process_iter_into(cmd, buffer, input=stdin, **self.get_process_kwargs())
+        try:
+            yield from output
+        finally:
+            output.close()
+
+    def get_runner(self) -> Runner:
+        "Get the runner of the program (or of the context)"
+        return self.runner if self.runner is not None else get_runner()
 
     def get_process_kwargs(self):
-        return dict(
-            timeout=self.timeout, cwd=self.cwd, encoding=self.encoding,
+        # The output is decoded by the program (parse_output)
+        kwargs = dict(
+            timeout=self.timeout, cwd=self.cwd,
+        )
+        if self.stdout is not None:
+            kwargs['stdout'] = self.stdout
+        if self.stderr is not None:
+            kwargs['stderr'] = self.stderr
+        if self.env is not None:
+            kwargs['env'] = self.env
+        if self.priority is not None:
+            kwargs['priority'] = self.priority
+        if self.group is not None:
+            kwargs['group'] = self.group
+        return kwargs
+
+    def get_cache_key(self, cmd:List[str], stdin) -> Union[str, None]:
+        """Get the key of the call for the cache and the
+        single-flight (None if neither is used)"""
+        if self._get_cache() is None and not self.single_flight:
+            return None
+        if self.stdout not in (None, 'capture'):
+            return None
+        if isinstance(stdin, str):
+            stdin = to_bytes(stdin)
+        elif not isinstance(stdin, (bytes, os.PathLike, type(None))):
+            # Streamed input
+            return None
+        return make_key(
+            cmd, stdin, cwd=self.cwd, env=self.env,
+            input_files=self.input_files, mode=self.file_fingerprint,
         )
 
     def parse_args(self, args:tuple) -> Tuple[List[str], ByteString]:
@@ -79,7 +448,12 @@ class BaseProgram:
             args = program + list(args)
         for arg in args:
             if isinstance(arg, Input):
-                stdin = arg.read()
+                if arg.is_file:
+                    # Handed over as the stdin of the process
+                    stdin = arg.data
+                else:
+                    # Streams are written to the process as they are read
+                    stdin = arg if arg.is_stream else arg.read()
             else:
                 cmd.append(str(arg))
         return cmd, stdin
@@ -98,18 +472,20 @@ class BaseProgram:
         return cmd, None
 
     def parse_output(self, output):
-        cls = self.output_type
-        parser = self.output_parser
-        if cls in ('str', str):
-            output = to_string(output)
-        elif cls in ('bytes', bytes):
-            output = to_bytes(output)
-
-        if parser is None:
-            if output in ('', b''):
-                return None
-            return output
-        return parser(output)
+        return _parse_output(output, self.output_type, self.output_parser, self.encoding, self.errors, self.newline)
+
+    async def parse_output_async(self, output):
+        """Parse the output in the parse_executor if it is
+        large enough (to not block the event loop)"""
+        if self.parse_executor is None or len(output) < self.parse_threshold:
+            return self.parse_output(output)
+        executor = _get_parse_executor(self.parse_executor, output)
+        loop = asyncio.get_running_loop()
+        # Only what parsing needs is sent (the program may not pickle)
+        return await loop.run_in_executor(
+            executor, _parse_output,
+            output, self.output_type, self.output_parser, self.encoding, self.errors, self.newline,
+        )
 
     def _format_key(self, key:str):
         if key.startswith("-"):
@@ -139,17 +515,24 @@ class BaseProgram:
             setattr(prog, key, val)
         return prog
 
+    def __or__(self, other) -> 'Pipeline':
+        return Pipeline(self, other)
+
+    def pipe(self, other) -> 'Pipeline':
+        "Connect the stdout of this program to the stdin of the other"
+        return Pipeline(self, other)
+
     def start(self, *args, **kwargs):
         "Start the program"
         cmd, stdin = self.get_command(*args, **kwargs)
-        proc = start_process(cmd, input=stdin, **self.get_process_kwargs())
+        proc = self.get_runner().start_program(cmd, input=stdin, **self.get_process_kwargs())
         proc.output_parser = self.parse_output
         return proc
 
     async def start_async(self, *args, **kwargs):
         "Start the program"
         cmd, stdin = self.get_command(*args, **kwargs)
-        proc = await start_process_async(cmd, input=stdin, **self.get_process_kwargs())
+        proc = await self.get_runner().start_program_async(cmd, input=stdin, **self.get_process_kwargs())
         proc.output_parser = self.parse_output
         return proc
 
@@ -1,81 +1,277 @@
 from abc import abstractmethod
+from contextlib import contextmanager, asynccontextmanager
+import os
+import sys
 import asyncio
-from typing import Union, Generator
+from contextvars import ContextVar
+from typing import AsyncGenerator, Callable, Union, Generator
 import subprocess
 
-from .process import ProcessError, Process, AsyncProcess, _raise_for_error
+from .process import ProcessError, Process, AsyncProcess, Tee, _raise_for_error
+from .output import Spool, Tail
+from .scheduler import Scheduler
+from .utils import get_fileno, write_to
+
+# Output routing modes and their Popen values
+_OUTPUT_MODES = {
+    'capture': subprocess.PIPE,
+    'discard': subprocess.DEVNULL,
+    'inherit': None,
+}
+
+def _get_routes(kwargs, cls) -> dict:
+    "Get the outputs routed with the given class (ie. Tee)"
+    return {name: kwargs[name] for name in ('stdout', 'stderr') if isinstance(kwargs.get(name), cls)}
+
+def _start_routes(proc, kwargs):
+    "Set up the outputs that are read by the process wrapper"
+    proc.tee(**_get_routes(kwargs, Tee))
+    proc.spool(**_get_routes(kwargs, Spool))
+
+def _route_output(route, data:bytes):
+    """Route output that was already captured (ie. by
+    a worker) and return what is kept of it"""
+    if isinstance(route, Spool):
+        sink = route.create()
+        sink.write(data)
+        return sink.result()
+    if route in (None, 'capture'):
+        return data
+    if isinstance(route, Tee):
+        write_to(route.target, data)
+        return data
+    if route != 'discard':
+        write_to(sys.stdout if route == 'inherit' else route, data)
+    return b''
+
+@contextmanager
+def _open_files(input, kwargs):
+    """Hand over files (paths or file objects) as the stdio
+    of the child so that the data does not pass through Python
+
+    The output routing modes ('capture', 'discard', 'inherit')
+    are turned to Popen values and tees are captured.
+    Yields the remaining input and the Popen arguments.
+    The parent's copies are closed at exit."""
+    kwargs = kwargs.copy()
+    files = []
+    try:
+        if isinstance(input, os.PathLike):
+            input = open(input, 'rb')
+            files.append(input)
+        fileno = get_fileno(input)
+        if fileno is not None:
+            kwargs['stdin'] = fileno
+            input = None
+        for name in ('stdout', 'stderr'):
+            value = kwargs.get(name)
+            if isinstance(value, str):
+                if value not in _OUTPUT_MODES:
+                    raise ValueError(f"Invalid output mode: {value!r}")
+                kwargs[name] = _OUTPUT_MODES[value]
+            elif isinstance(value, Spool) and not isinstance(value, Tail) and name == 'stderr':
+                raise ValueError("Only stdout can be spooled")
+            elif isinstance(value, (Tee, Spool)):
+                kwargs[name] = subprocess.PIPE
+            elif isinstance(value, os.PathLike):
+                file = open(value, 'wb')
+                files.append(file)
+                kwargs[name] = file.fileno()
+        yield input, kwargs
+    finally:
+        for file in files:
+            file.close()
+
+@contextmanager
+def _no_slot():
+    yield
+
+@asynccontextmanager
+async def _no_slot_async():
+    yield
+
+def _pop_schedule(cmd, kwargs) -> dict:
+    "Pop the scheduling options (the group is the program name by default)"
+    return dict(
+        group=kwargs.pop('group', None) or os.path.basename(cmd[0]),
+        priority=kwargs.pop('priority', None) or 'normal',
+    )
 
 class Runner:
     "Command-line runner"
 
-    def __init__(self, output=str):
+    def __init__(self, output=str, popen:Callable[..., subprocess.Popen]=None, scheduler:Scheduler=None):
         self.kwargs = {
             'stdin': subprocess.PIPE,
             'stdout': subprocess.PIPE,
             'stderr': subprocess.PIPE,
         }
         self.output = output
+        # Launches the (sync) processes, ie. subprocess.Popen
+        # or a Popen-like backend (ie. scriptor.spawn.SpawnHelper)
+        self.popen = popen or subprocess.Popen
+        # Limits the processes run at once (the started
+        # processes are not counted)
+        self.scheduler = scheduler
+
+    def _slot(self, cmd, kwargs):
+        "Wait for a turn to run (if scheduled)"
+        schedule = _pop_schedule(cmd, kwargs)
+        if self.scheduler is None:
+            return _no_slot()
+        return self.scheduler.slot(**schedule)
+
+    def _slot_async(self, cmd, kwargs):
+        schedule = _pop_schedule(cmd, kwargs)
+        if self.scheduler is None:
+            return _no_slot_async()
+        return self.scheduler.slot_async(**schedule)
 
     def start_program(self, cmd, input=None, timeout=None, **kwargs) -> Process:
         "Start the process"
+        _pop_schedule(cmd, kwargs)
         kwds = self.kwargs.copy()
         kwds.update(kwargs)
-        proc = Process(subprocess.Popen(cmd, **kwds), cmd=cmd)
+        with _open_files(input, kwds) as (input, popen_kwds):
+            proc = Process(self.popen(cmd, **popen_kwds), cmd=cmd)
+        _start_routes(proc, kwds)
         if input is not None:
             proc.write(input)
         return proc
 
     async def start_program_async(self, cmd, input=None, timeout=None, **kwargs) -> AsyncProcess:
         "Start the process"
+        _pop_schedule(cmd, kwargs)
         kwds = self.kwargs.copy()
         kwds.pop("text", None) # asyncio.Process does not accept text for some reason
         #kwds.pop("stdin", None)
         kwds.update(kwargs)
 
-        proc = AsyncProcess(
-            await asyncio.create_subprocess_exec(*cmd, **kwds), 
-            cmd=cmd
-        )
+        with _open_files(input, kwds) as (input, popen_kwds):
+            proc = AsyncProcess(
+                await asyncio.create_subprocess_exec(*cmd, **popen_kwds),
+                cmd=cmd
+            )
+        _start_routes(proc, kwds)
         if input is not None:
             proc.write(input)
         return proc
 
     def run_process_sync(self, cmd, input=None, timeout=None, **kwargs) -> bytes:
         "Run process and return the output"
+        with self._slot(cmd, kwargs):
+            return self._run_sync(cmd, input=input, timeout=timeout, **kwargs)
+
+    def _run_sync(self, cmd, input=None, timeout=None, **kwargs) -> bytes:
+        if self.popen is not subprocess.Popen or not isinstance(input, (bytes, str, type(None))) or _get_routes(kwargs, (Tee, Spool)):
+            # Streamed input, outputs read by the wrapper or custom backend
+            # (the outputs are opened by start_program)
+            with _open_files(input, {}) as (input, stdin):
+                proc = self.start_program(cmd, **{**kwargs, **stdin})
+            proc.write_stream(input)
+            try:
+                proc.finish(timeout=timeout)
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+            proc.raise_for_return()
+            return proc.get_stdout()
+
         kwds = self.kwargs.copy()
         kwds.pop("stdin", None)
         kwds.update(kwargs)
 
-        proc = subprocess.run(cmd, input=input, timeout=timeout, **kwds)
+        with _open_files(input, kwds) as (input, kwds):
+            proc = subprocess.run(cmd, input=input, timeout=timeout, **kwds)
         _raise_for_error(proc.returncode, cmd=cmd, stdout=proc.stdout, stderr=proc.stderr)
         return proc.stdout
 
     async def run_process_async(self, cmd, input=None, timeout=None, **kwargs) -> bytes:
         "Run process async"
+        async with self._slot_async(cmd, kwargs):
+            return await self._run_async(cmd, input=input, timeout=timeout, **kwargs)
+
+    async def _run_async(self, cmd, input=None, timeout=None, **kwargs) -> bytes:
         proc = await self.start_program_async(cmd, input=input, **kwargs)
-        await asyncio.wait_for(proc.wait(), timeout=timeout)
+        try:
+            # Read the pipes while the process runs so it
+            # does not block on a full pipe
+            await asyncio.wait_for(proc.finish(), timeout=timeout)
+        except BaseException:
+            # Timeout or cancellation, don't leave the child running
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
 
         await proc.raise_for_return()
         out = await proc.get_stdout()
 
         return out
 
-    def run_process_iter(self, cmd, input=None, **kwargs) -> Generator[bytes, None, None]:
-        "Run and iterate the process output"
-        proc = self.start_program(cmd, input=input, **kwargs)
+    def run_process_iter(self, cmd, input=None, timeout=None, chunk:Union[str, int]='line', partial_chunks:bool=False, **kwargs) -> Generator[bytes, None, None]:
+        "Run and iterate the process output (by lines or chunks of given size)"
+        with self._slot(cmd, kwargs):
+            proc = self.start_program(cmd, input=input, **kwargs)
+            output = proc.iter_output(chunk, partial_chunks)
+            try:
+                yield from output
+            finally:
+                # Kills the process if the iteration stopped early
+                output.close()
 
-        while True:
-            line = proc.stdout.readline()
-            if line in (b'', ''):
-                break
-            yield line
-        proc.stdout.close()
-        _raise_for_error(proc.returncode, cmd=cmd, stdout=proc.stdout, stderr=proc.stderr)
+    def run_process_iter_into(self, cmd, buffer:Union[bytearray, memoryview], input=None, timeout=None, **kwargs) -> Generator[memoryview, None, None]:
+        "Run and iterate the process output by filling the buffer"
+        with self._slot(cmd, kwargs):
+            proc = self.start_program(cmd, input=input, **kwargs)
+            output = proc.iter_into(buffer)
+            try:
+                yield from output
+            finally:
+                # Kills the process if the iteration stopped early
+                output.close()
+
+    async def run_process_iter_async(self, cmd, input=None, timeout=None, chunk:Union[str, int]='line', partial_chunks:bool=False, **kwargs) -> AsyncGenerator[bytes, None]:
+        "Run and iterate the process output async (by lines or chunks of given size)"
+        async with self._slot_async(cmd, kwargs):
+            proc = await self.start_program_async(cmd, input=input, **kwargs)
+            output = proc.iter_output(chunk, partial_chunks)
+            try:
+                async for data in output:
+                    yield data
+            finally:
+                # Kills the process if the iteration stopped early
+                await output.aclose()
 
 DEFAULT_RUNNER = Runner()
 
+# Set by use_runner()
+_current_runner = ContextVar('scriptor_runner', default=None)
+
+def get_runner() -> Runner:
+    "Get the runner of the current context"
+    return _current_runner.get() or DEFAULT_RUNNER
+
+@contextmanager
+def use_runner(runner:Runner):
+    """Run the programs with the runner in this context
+    (unless they set their own)
+
+    .. code-block:: python
+
+        with use_runner(Runner(popen=SpawnHelper())):
+            git('status')
+    """
+    token = _current_runner.set(runner)
+    try:
+        yield runner
+    finally:
+        _current_runner.reset(token)
+
 run_process_sync = DEFAULT_RUNNER.run_process_sync
 run_process_async = DEFAULT_RUNNER.run_process_async
 run_process_iter = DEFAULT_RUNNER.run_process_iter
+run_process_iter_async = DEFAULT_RUNNER.run_process_iter_async
+run_process_iter_into = DEFAULT_RUNNER.run_process_iter_into
 start_process = DEFAULT_RUNNER.start_program
 start_process_async = DEFAULT_RUNNER.start_program_async
\ No newline at end of file
@@ -0,0 +1,170 @@
+import os
+import time
+import bisect
+import asyncio
+import threading
+from collections import Counter
+from contextlib import contextmanager, asynccontextmanager
+from itertools import count
+from typing import Dict, Optional, Union
+
+# Named priority classes (lower runs first)
+PRIORITIES = {
+    'high': -10,
+    'normal': 0,
+    'low': 10,
+}
+
+class _Waiter:
+    "A call waiting for its turn"
+
+    def __init__(self, group:str, priority:int, seq:int):
+        self.group = group
+        self.key = (priority, seq)
+        self.queued_at = time.monotonic()
+        self.granted = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._set_future)
+
+    def _set_future(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+class Scheduler:
+    """Limits how many processes run at once
+
+    At most max_concurrency processes run in total and at
+    most the quota (by group, default_quota for others) in
+    a group. The groups are the names of the programs
+    unless set. The calls that wait start in the order of
+    their priority and then in the order they came, from
+    threads and event loops alike.
+
+    .. code-block:: python
+
+        runner = Runner(scheduler=Scheduler(8, quotas={'ffmpeg': 2}))
+    """
+
+    def __init__(self, max_concurrency:Optional[int]=None, quotas:Optional[Dict[str, int]]=None, default_quota:Optional[int]=None):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.quotas = dict(quotas or {})
+        self.default_quota = default_quota
+        self._lock = threading.Lock()
+        self._queue = []
+        self._seq = count()
+        self._running = 0
+        self._groups = Counter()
+
+        self._started = 0
+        self._max_queued = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @contextmanager
+    def slot(self, group:Optional[str]=None, priority:Union[str, int]='normal'):
+        "Wait for a turn to run (in a thread)"
+        waiter = self._create_waiter(group, priority)
+        waiter.event = threading.Event()
+        self._enqueue(waiter)
+        try:
+            waiter.event.wait()
+        except BaseException:
+            # Interrupted, the turn may have been given already
+            self._cancel(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    @asynccontextmanager
+    async def slot_async(self, group:Optional[str]=None, priority:Union[str, int]='normal'):
+        "Wait for a turn to run (in an event loop)"
+        waiter = self._create_waiter(group, priority)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        self._enqueue(waiter)
+        try:
+            await waiter.future
+        except BaseException:
+            # Cancelled, the turn may have been given already
+            self._cancel(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(waiter)
+
+    def _create_waiter(self, group, priority) -> _Waiter:
+        priority = PRIORITIES[priority] if isinstance(priority, str) else priority
+        return _Waiter(group, priority, next(self._seq))
+
+    def _enqueue(self, waiter:_Waiter):
+        with self._lock:
+            bisect.insort(self._queue, waiter)
+            self._max_queued = max(self._max_queued, len(self._queue))
+            self._dispatch()
+
+    def _release(self, waiter:_Waiter):
+        with self._lock:
+            self._running -= 1
+            self._groups[waiter.group] -= 1
+            self._dispatch()
+
+    def _cancel(self, waiter:_Waiter):
+        with self._lock:
+            if not waiter.granted:
+                self._queue.remove(waiter)
+                return
+        self._release(waiter)
+
+    def _dispatch(self):
+        "Start the waiters that can run (holding the lock)"
+        for waiter in list(self._queue):
+            if self._running >= self.max_concurrency:
+                break
+            quota = self.quotas.get(waiter.group, self.default_quota)
+            if quota is not None and self._groups[waiter.group] >= quota:
+                # Does not block the other groups
+                continue
+            self._queue.remove(waiter)
+            self._running += 1
+            self._groups[waiter.group] += 1
+            wait = time.monotonic() - waiter.queued_at
+            self._started += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            waiter.granted = True
+            waiter.wake()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def metrics(self) -> dict:
+        "Get the queue depth and the wait times (in seconds)"
+        with self._lock:
+            return {
+                'running': self._running,
+                'queued': len(self._queue),
+                'max_queued': self._max_queued,
+                'started': self._started,
+                'wait_total': self._wait_total,
+                'wait_max': self._wait_max,
+                'wait_mean': self._wait_total / self._started if self._started else 0.0,
+                'groups': {group: n for group, n in self._groups.items() if n},
+            }
@@ -0,0 +1,484 @@
+import io
+import os
+import sys
+import time
+import errno
+import array
+import shutil
+import pickle
+import select
+import signal
+import socket
+import struct
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from textwrap import dedent
+from typing import List, Optional, Tuple
+
+from .process import _read_streams
+
+_STATUS = struct.Struct("!q")
+_HEADER = struct.Struct("!Q")
+
+def _send_fds(sock:socket.socket, data:bytes, fds:List[int]):
+    "Send file descriptors over a Unix socket (SCM_RIGHTS)"
+    sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))])
+
+def _recv_fds(sock:socket.socket, size:int, maxfds:int) -> Tuple[bytes, List[int]]:
+    "Receive file descriptors over a Unix socket (SCM_RIGHTS)"
+    fds = array.array("i")
+    msg, ancdata, flags, addr = sock.recvmsg(size, socket.CMSG_LEN(maxfds * fds.itemsize))
+    for level, type_, data in ancdata:
+        if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    return msg, list(fds)
+
+def _recv_exact(sock:socket.socket, size:int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("Connection closed")
+        data += chunk
+    return data
+
+def _open_stdio(stdin=None, stdout=None, stderr=None) -> Tuple[List[int], List[int], list]:
+    """Turn Popen-style stdio arguments to file descriptors
+    for the child
+
+    Returns the child's fds, the fds to close after sending
+    them and the parent's ends of the pipes"""
+    child_fds = []
+    to_close = []
+    parent_files = []
+    for i, (value, mode) in enumerate(((stdin, 'wb'), (stdout, 'rb'), (stderr, 'rb'))):
+        parent_file = None
+        if value == subprocess.PIPE:
+            read_fd, write_fd = os.pipe()
+            child_fd, parent_fd = (read_fd, write_fd) if i == 0 else (write_fd, read_fd)
+            parent_file = open(parent_fd, mode)
+            to_close.append(child_fd)
+        elif value == subprocess.DEVNULL:
+            child_fd = os.open(os.devnull, os.O_RDWR)
+            to_close.append(child_fd)
+        elif value == subprocess.STDOUT:
+            child_fd = child_fds[1]
+        elif value is None:
+            child_fd = i
+        elif isinstance(value, int):
+            child_fd = value
+        else:
+            child_fd = value.fileno()
+        child_fds.append(child_fd)
+        parent_files.append(parent_file)
+    return child_fds, to_close, parent_files
+
+class _PopenLike(ABC):
+    "Base for Popen-like handles of processes not launched by subprocess.Popen"
+
+    args = None
+    pid: int
+    returncode: Optional[int] = None
+
+    @abstractmethod
+    def poll(self) -> Optional[int]:
+        "Get the returncode (None if running)"
+
+    @abstractmethod
+    def wait(self, timeout=None) -> int:
+        "Wait for the process to finish and get the returncode"
+
+    def communicate(self, input=None, timeout=None) -> Tuple[bytes, bytes]:
+        writer = None
+        if self.stdin is not None:
+            # Write in a thread so a large input
+            # does not block reading the output
+            writer = threading.Thread(target=self._write_input, args=(input,), daemon=True)
+            writer.start()
+        stdout, stderr = _read_streams(self.stdout, self.stderr)
+        if writer is not None:
+            writer.join()
+        self.wait(timeout=timeout)
+        return (stdout if self.stdout is not None else None), (stderr if self.stderr is not None else None)
+
+    def _write_input(self, input):
+        try:
+            if input:
+                self.stdin.write(input)
+            self.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def send_signal(self, sig):
+        if self.poll() is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def __repr__(self):
+        return f"<{type(self).__name__}: returncode: {self.returncode} args: {self.args!r}>"
+
+class RemoteProcess(_PopenLike):
+    """Popen-like handle for a process launched by
+    another (server) process
+
+    The server reports the pid and the exit status
+    of the process over the connection. If the server
+    is gone first, the process is polled by its pid."""
+
+    def __init__(self, args, conn:socket.socket, stdin=None, stdout=None, stderr=None):
+        self.args = args
+        self._conn = conn
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self.pid = _STATUS.unpack(_recv_exact(conn, _STATUS.size))[0]
+        if self.pid == 0:
+            # Launching failed, the server sends the exception
+            size = _HEADER.unpack(_recv_exact(conn, _HEADER.size))[0]
+            exc = pickle.loads(_recv_exact(conn, size))
+            conn.close()
+            for file in (stdin, stdout, stderr):
+                if file is not None:
+                    file.close()
+            raise exc
+
+    def poll(self) -> Optional[int]:
+        if self.returncode is None:
+            if self._conn is None:
+                self._check_exited()
+            elif select.select([self._conn], [], [], 0)[0]:
+                self._read_status()
+        return self.returncode
+
+    def wait(self, timeout=None) -> int:
+        endtime = time.monotonic() + timeout if timeout is not None else None
+        delay = 0.0005
+        while self.poll() is None:
+            remaining = endtime - time.monotonic() if endtime is not None else None
+            if remaining is not None and remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            if self._conn is not None:
+                # Until the server reports (or is gone)
+                select.select([self._conn], [], [], remaining)
+            else:
+                delay = min(delay * 2, 0.05)
+                time.sleep(delay if remaining is None else min(delay, remaining))
+        return self.returncode
+
+    def _read_status(self):
+        try:
+            self.returncode = _STATUS.unpack(_recv_exact(self._conn, _STATUS.size))[0]
+        except EOFError:
+            # The server is gone (ie. closed) before the
+            # process, which is then polled by the pid
+            self._check_exited()
+        self._conn.close()
+        self._conn = None
+
+    def _check_exited(self):
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            # Finished but the exit status is not known
+            self.returncode = -1
+        except PermissionError:
+            pass
+
+class SpawnedProcess(_PopenLike):
+    "Popen-like handle for a process launched with os.posix_spawn"
+
+    def __init__(self, args, pid:int, stdin=None, stdout=None, stderr=None):
+        self.args = args
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self._lock = threading.Lock()
+
+    def poll(self) -> Optional[int]:
+        return self._try_wait(os.WNOHANG)
+
+    def wait(self, timeout=None) -> int:
+        if timeout is None:
+            # Blocks in waitpid (a poll() or a kill() from
+            # another thread meanwhile does not wait for it)
+            with self._lock:
+                if self.returncode is None:
+                    self._set_status(*self._waitpid(0))
+            return self.returncode
+        # Polled as waitpid has no timeout
+        endtime = time.monotonic() + timeout
+        delay = 0.0005
+        while self.poll() is None:
+            remaining = endtime - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            delay = min(delay * 2, remaining, 0.05)
+            time.sleep(delay)
+        return self.returncode
+
+    def _try_wait(self, flags) -> Optional[int]:
+        if not self._lock.acquire(blocking=False):
+            # Another thread is waiting for it
+            return None
+        try:
+            if self.returncode is None:
+                self._set_status(*self._waitpid(flags))
+        finally:
+            self._lock.release()
+        return self.returncode
+
+    def _waitpid(self, flags) -> Tuple[int, int]:
+        try:
+            return os.waitpid(self.pid, flags)
+        except ChildProcessError:
+            # Reaped elsewhere
+            return self.pid, 0
+
+    def _set_status(self, pid:int, status:int):
+        if pid == self.pid:
+            self.returncode = _status_to_returncode(status)
+
+    def send_signal(self, sig):
+        # Only the returncode is checked (as Popen does) so
+        # that a wait() in another thread does not block it
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                # Reaped but the returncode is not yet set
+                pass
+
+def _status_to_returncode(status:int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def _wrap_text(files:list, encoding=None, errors=None, text=None, universal_newlines=None) -> list:
+    "Wrap the binary stdio files to text files if text mode is requested"
+    if not (encoding or errors or text or universal_newlines):
+        return files
+    return [
+        None if file is None else io.TextIOWrapper(file, encoding=encoding, errors=errors, write_through=i == 0)
+        for i, file in enumerate(files)
+    ]
+
+_POSIX_SPAWN_DEFAULTS = {
+    'bufsize': -1, 'executable': None, 'shell': False, 
+    'cwd': None, 'restore_signals': True, 'start_new_session': False, 
+    'pass_fds': (), 'preexec_fn': None, 
+}
+
+def posix_spawn(args, stdin=None, stdout=None, stderr=None, env=None, encoding=None, errors=None, text=None, universal_newlines=None, **kwargs):
+    """Launch a process with os.posix_spawn (Popen-like)
+
+    posix_spawn skips duplicating the parent's page tables.
+    Falls back to subprocess.Popen if the options are not
+    supported by posix_spawn (ie. cwd or preexec_fn).
+
+    close_fds (true by default as in Popen) needs
+    os.POSIX_SPAWN_CLOSEFROM (Python 3.13+), otherwise it
+    falls back to Popen too. Pass close_fds=False to use
+    posix_spawn anyway: the descriptors made inheritable
+    (ie. with os.set_inheritable) are then passed to the
+    child. The ones Python creates are not (close-on-exec)."""
+    close_fds = kwargs.pop('close_fds', True)
+    supported = hasattr(os, 'posix_spawn') and all(
+        key in _POSIX_SPAWN_DEFAULTS and _POSIX_SPAWN_DEFAULTS[key] == value
+        for key, value in kwargs.items()
+    ) and (not close_fds or hasattr(os, 'POSIX_SPAWN_CLOSEFROM'))
+    kwargs['close_fds'] = close_fds
+    if not supported or isinstance(args, (str, bytes, os.PathLike)):
+        return subprocess.Popen(
+            args, stdin=stdin, stdout=stdout, stderr=stderr, env=env,
+            encoding=encoding, errors=errors, text=text, universal_newlines=universal_newlines, 
+            **kwargs
+        )
+
+    argv = [os.fspath(arg) for arg in args]
+    env = os.environ if env is None else env
+    executable = argv[0]
+    if os.path.dirname(executable) == '':
+        executable = shutil.which(executable, path=env.get('PATH', os.defpath))
+        if executable is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), argv[0])
+
+    child_fds, to_close, parent_files = _open_stdio(stdin, stdout, stderr)
+    file_actions = []
+    for target, fd in enumerate(child_fds):
+        if fd != target:
+            file_actions.append((os.POSIX_SPAWN_DUP2, fd, target))
+    if close_fds:
+        file_actions.append((os.POSIX_SPAWN_CLOSEFROM, 3))
+    try:
+        pid = os.posix_spawn(executable, argv, env, file_actions=file_actions, setsigdef=_default_signals())
+    except BaseException:
+        for file in parent_files:
+            if file is not None:
+                file.close()
+        raise
+    finally:
+        for fd in to_close:
+            os.close(fd)
+    return SpawnedProcess(args, pid, *_wrap_text(parent_files, encoding, errors, text, universal_newlines))
+
+def _default_signals() -> tuple:
+    # Popen's restore_signals
+    return tuple(
+        getattr(signal, name) for name in ('SIGPIPE', 'SIGXFZ', 'SIGXFSZ') 
+        if hasattr(signal, name)
+    )
+
+# Code the spawn helper runs. It only needs the
+# standard library.
+_HELPER_CODE = dedent("""
+    import array, os, pickle, selectors, signal, socket, struct, subprocess, sys
+
+    HEADER = struct.Struct("!Q")
+    STATUS = struct.Struct("!q")
+
+    def recv_exact(sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def recv_fds(sock, maxfds):
+        fds = array.array("i")
+        msg, ancdata, flags, addr = sock.recvmsg(1, socket.CMSG_LEN(maxfds * fds.itemsize))
+        for level, type_, data in ancdata:
+            if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+        return msg, list(fds)
+
+    def launch(conn, stdio):
+        cmd, kwargs = pickle.loads(recv_exact(conn, HEADER.unpack(recv_exact(conn, HEADER.size))[0]))
+        try:
+            proc = subprocess.Popen(cmd, stdin=stdio[0], stdout=stdio[1], stderr=stdio[2], **kwargs)
+        except Exception as exc:
+            data = pickle.dumps(exc, 4)
+            conn.sendall(STATUS.pack(0) + HEADER.pack(len(data)) + data)
+            conn.close()
+            return None
+        finally:
+            for fd in set(stdio):
+                os.close(fd)
+        conn.sendall(STATUS.pack(proc.pid))
+        return proc
+
+    def main():
+        ctrl = socket.socket(fileno=int(sys.argv[1]))
+
+        # Wake up the selector when a child finishes
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_w.setblocking(False)
+        signal.set_wakeup_fd(wakeup_w.fileno())
+        signal.signal(signal.SIGCHLD, lambda *args: None)
+
+        children = {}
+        selector = selectors.DefaultSelector()
+        selector.register(ctrl, selectors.EVENT_READ)
+        selector.register(wakeup_r, selectors.EVENT_READ)
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is wakeup_r:
+                    wakeup_r.recv(4096)
+                    continue
+                msg, fds = recv_fds(ctrl, 4)
+                if not msg:
+                    # The parent is gone
+                    return
+                conn = socket.socket(fileno=fds[0])
+                proc = launch(conn, fds[1:])
+                if proc is not None:
+                    children[proc.pid] = (conn, proc)
+
+            # Report the finished children
+            while children:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+                conn, proc = children.pop(pid)
+                proc.returncode = returncode
+                try:
+                    conn.sendall(STATUS.pack(returncode))
+                except OSError:
+                    pass
+                conn.close()
+
+    main()
+""")
+
+class SpawnHelper:
+    """Small helper process that launches the processes
+    on behalf of the parent
+
+    Forking a parent with a large memory footprint is
+    expensive. Start the helper early (while the parent
+    is still small) and pass it as Runner's popen:
+
+    .. code-block:: python
+
+        runner = Runner(popen=SpawnHelper())
+
+    The stdio is passed to the helper over a Unix socket
+    so the returned processes behave like Popen."""
+
+    def __init__(self, interpreter=sys.executable):
+        if not hasattr(socket, 'AF_UNIX'): # pragma: no cover
+            raise OSError("Spawn helper requires Unix sockets")
+        self._ctrl, child_ctrl = socket.socketpair()
+        self._proc = subprocess.Popen(
+            [interpreter, "-I", "-S", "-c", _HELPER_CODE, str(child_ctrl.fileno())],
+            pass_fds=[child_ctrl.fileno()], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        )
+        child_ctrl.close()
+        self._lock = threading.Lock()
+
+    def __call__(self, args, stdin=None, stdout=None, stderr=None, encoding=None, errors=None, text=None, universal_newlines=None, **kwargs) -> RemoteProcess:
+        "Launch a process (Popen-like)"
+        cmd = [args] if isinstance(args, (str, bytes, os.PathLike)) else list(args)
+        request = pickle.dumps(([os.fspath(arg) for arg in cmd], kwargs), 4)
+
+        conn, child_conn = socket.socketpair()
+        child_fds, to_close, parent_files = _open_stdio(stdin, stdout, stderr)
+        try:
+            with self._lock:
+                _send_fds(self._ctrl, b"S", [child_conn.fileno(), *child_fds])
+        finally:
+            child_conn.close()
+            for fd in to_close:
+                os.close(fd)
+        conn.sendall(_HEADER.pack(len(request)) + request)
+
+        return RemoteProcess(args, conn, *_wrap_text(parent_files, encoding, errors, text, universal_newlines))
+
+    def close(self):
+        """Close the helper
+
+        The running processes are left running. Their
+        returncode is -1 when they finish as the exit
+        status is then not known."""
+        self._ctrl.close()
+        self._proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,77 @@
+from textwrap import dedent
+
+import pytest
+from scriptor.program import Input
+from scriptor.process import ProcessError
+from scriptor.builtin import current_python, PythonPool
+
+@pytest.fixture
+def python():
+    python = current_python.use_pool(workers=2, preload=["json"])
+    yield python
+    python.pool.close()
+
+def test_pool_run(tmpdir, python):
+    tmpdir.mkdir("files")
+    py_file = tmpdir.join("files/myscript.py")
+    py_file.write(dedent("""
+        import sys
+        print("Hello world", *sys.argv[1:])
+        """))
+
+    assert python.run_code("print('Hello world')") == 'Hello world'
+    assert python.run_script(py_file) == "Hello world"
+    assert python.run_script(py_file, "arg", rd="2022-01-01") == "Hello world arg -rd 2022-01-01"
+    assert python.use(cwd=tmpdir).run_module("files.myscript") == "Hello world"
+
+def test_pool_preload(python):
+    assert python.run_code("import sys; print('json' in sys.modules)") == "True"
+
+def test_pool_input(tmpdir, python):
+    py_file = tmpdir.join("myscript.py")
+    py_file.write(dedent("""
+        print(input() + " world")
+        """))
+    assert python.run_script(py_file, Input("Hello")) == "Hello world"
+
+def test_pool_error(python):
+    with pytest.raises(ProcessError) as exc_info:
+        python.run_code("print('Hello'); raise RuntimeError('Oops')")
+    exc = exc_info.value
+    assert exc.returncode == 1
+    assert exc.stdout == "Hello"
+    assert str(exc).endswith("RuntimeError: Oops")
+
+    with pytest.raises(ProcessError) as exc_info:
+        python.run_code("import sys; sys.exit(3)")
+    assert exc_info.value.returncode == 3
+
+    # Pool is still usable
+    assert python.run_code("print('Hello')") == "Hello"
+
+def test_pool_worker_exit():
+    with PythonPool(workers=1) as pool:
+        returncode, stdout, stderr = pool.run('code', "import os; os._exit(4)")
+        assert returncode == 4
+        assert pool.run('code', "print('Hello')") == (0, b"Hello\n", b"")
+
+def test_pool_recycle():
+    with PythonPool(workers=1, max_tasks=2) as pool:
+        pids = [pool.run('code', "import os; print(os.getpid())")[1] for _ in range(4)]
+        assert pids[0] == pids[1]
+        assert pids[1] != pids[2]
+        assert pids[2] == pids[3]
+
+    with PythonPool(workers=1, max_memory=1) as pool:
+        pids = [pool.run('code', "import os; print(os.getpid())")[1] for _ in range(2)]
+        assert pids[0] != pids[1]
+
+def test_pool_env():
+    python = current_python.use_pool(workers=1)
+    code = "import os; print(os.environ.get('FOO'))"
+    try:
+        assert python.use(env={"FOO": "bar"}).run_code(code) == "bar"
+        # Restored for the next task
+        assert python.run_code(code) == "None"
+    finally:
+        python.pool.close()
@@ -0,0 +1,83 @@
+import os
+import time
+import signal
+import subprocess
+import platform
+from textwrap import dedent
+
+import pytest
+from scriptor.program import Input
+from scriptor.process import Process, ProcessError
+from scriptor.builtin import current_python, Zygote
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="Zygote requires fork")
+
+@pytest.fixture
+def python():
+    python = current_python.use_zygote(preload=["json"])
+    yield python
+    python.zygote.close()
+
+def test_zygote_run(tmpdir, python):
+    tmpdir.mkdir("files")
+    py_file = tmpdir.join("files/myscript.py")
+    py_file.write(dedent("""
+        import os, sys
+        print("Hello world", *sys.argv[1:])
+        """))
+
+    assert python.run_code("print('Hello world')") == 'Hello world'
+    assert python.run_script(py_file) == "Hello world"
+    assert python.run_script(py_file, "arg", rd="2022-01-01") == "Hello world arg -rd 2022-01-01"
+    assert python.use(cwd=tmpdir).run_module("files.myscript") == "Hello world"
+    assert python.use(cwd=tmpdir).run_code("import os; print(os.getcwd())") == str(tmpdir)
+
+def test_zygote_isolated(python):
+    assert python.run_code("import sys; print('json' in sys.modules)") == "True"
+    pids = {python.run_code("import os; print(os.getpid())") for _ in range(3)}
+    assert len(pids) == 3
+    assert str(os.getpid()) not in pids
+
+def test_zygote_input(tmpdir, python):
+    py_file = tmpdir.join("myscript.py")
+    py_file.write(dedent("""
+        print(input() + " world")
+        """))
+    assert python.run_script(py_file, Input("Hello")) == "Hello world"
+
+def test_zygote_error(python):
+    with pytest.raises(ProcessError) as exc_info:
+        python.run_code("print('Hello'); raise RuntimeError('Oops')")
+    exc = exc_info.value
+    assert exc.returncode == 1
+    assert exc.stdout == "Hello"
+    assert str(exc).endswith("RuntimeError: Oops")
+
+    with pytest.raises(ProcessError) as exc_info:
+        python.run_code("import os; os._exit(3)")
+    assert exc_info.value.returncode == 3
+
+def test_zygote_process(monkeypatch):
+    monkeypatch.setenv("MY_VAR", "Hello")
+    with Zygote() as zygote:
+        proc = Process(zygote.start('code', "import os; print(os.environ['MY_VAR'])"))
+        proc.finish()
+        assert proc.returncode == 0
+        assert proc.get_stdout() == b"Hello\n"
+
+        proc = Process(zygote.start('code', "import time; time.sleep(5)"))
+        assert proc.running
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+        assert proc.returncode == -signal.SIGTERM
+
+def test_zygote_timeout(python):
+    python = python.use(timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        python.run_code("import time; time.sleep(3)")
+    assert time.monotonic() - start < 2
+
+def test_zygote_env(python):
+    output = python.use(env={"FOO": "bar"}).run_code("import os; print(os.environ.get('FOO'))")
+    assert output == "bar"
@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import pathlib
+
+import pytest
+from scriptor import Program, MemoryCache, DiskCache, no_cache
+from scriptor.cache import Cache, make_key
+from scriptor.program import Input
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+# Output changes on each run
+CODE = "import time, sys; print(time.perf_counter_ns(), *sys.argv[1:])"
+
+@pytest.fixture(params=["memory", "disk"])
+def cache(request, tmpdir):
+    if request.param == "memory":
+        return MemoryCache()
+    return DiskCache(pathlib.Path(str(tmpdir)) / "cache")
+
+@param_async
+async def test_cache(sync, cache):
+    python = Program(sys.executable, "-c", CODE, cache=cache)
+    async def run(*args, **kwargs):
+        return python(*args, **kwargs) if sync else await python.call_async(*args, **kwargs)
+
+    first = await run()
+    assert await run() == first
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+    # Different arguments
+    assert await run("arg") != first
+    assert await run("arg") == await run("arg")
+    assert cache.misses == 2
+
+    with no_cache():
+        assert await run() != first
+    assert cache.stats == {"hits": 3, "misses": 2}
+
+@param_async
+async def test_stdin(sync):
+    python = Program(sys.executable, "-c", "import time, sys; print(time.perf_counter_ns(), sys.stdin.read())", cache=MemoryCache())
+    async def run(*args):
+        return python(*args) if sync else await python.call_async(*args)
+    first = await run(Input("input"))
+    assert await run(Input("input")) == first
+    assert await run(Input("other")) != first
+
+@pytest.mark.parametrize("change", ["cwd", "env", "parser"])
+def test_key(change, tmpdir):
+    cache = MemoryCache()
+    python = Program(sys.executable, "-c", CODE, cache=cache)
+    first = python()
+    if change == "cwd":
+        assert python.use(cwd=str(tmpdir))() != first
+    elif change == "env":
+        assert python.use(env={"VAR": "1"})() != first
+    else:
+        # The raw output is cached, the programs parse it themselves
+        assert python.use(output_type="bytes")() == first.encode() + b"\n"
+
+def test_make_key():
+    cmd = [sys.executable, "-c", "pass"]
+    assert make_key(cmd) == make_key(cmd)
+    assert make_key(cmd) != make_key(cmd, b"input")
+    assert make_key(cmd, env={"A": "1"}) != make_key(cmd, env={"A": "2"})
+    # Resolved from the PATH
+    assert make_key(["python3"], env={"PATH": "/nowhere"}) != make_key(["python3"], env={"PATH": "/usr/bin:/bin"})
+
+def test_lru():
+    cache = MemoryCache(maxsize=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert len(cache) == 2
+
+def test_ttl():
+    cache = MemoryCache(ttl=0.05)
+    cache.set("a", b"1")
+    assert cache.get("a") == b"1"
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+def test_disk_persists(tmpdir):
+    directory = pathlib.Path(str(tmpdir)) / "cache"
+    DiskCache(directory).set("a", b"")
+    cache = DiskCache(directory)
+    assert cache.get("a") == b""
+    assert len(cache) == 1
+    cache.clear()
+    assert cache.get("a") is None
+
+def test_errors_not_cached():
+    cache = MemoryCache()
+    python = Program(sys.executable, "-c", "import sys; sys.exit(1)", cache=cache)
+    for _ in range(2):
+        with pytest.raises(Exception):
+            python()
+    assert len(cache) == 0
+
+def test_not_captured(tmpdir):
+    cache = MemoryCache()
+    python = Program(sys.executable, "-c", CODE, cache=cache, stdout="discard")
+    python()
+    assert len(cache) == 0
+
+READ_CODE = "import sys, time; print(time.perf_counter_ns(), open(sys.argv[1]).read())"
+
+@pytest.mark.parametrize("mode", ["stat", "hash"])
+def test_file_argument(tmpdir, mode):
+    path = pathlib.Path(str(tmpdir)) / "input.txt"
+    path.write_text("first")
+    python = Program(sys.executable, "-c", READ_CODE, cache=MemoryCache(), file_fingerprint=mode)
+    first = python(path)
+    assert python(str(path)) == first
+    path.write_text("second")
+    second = python(path)
+    assert second.endswith("second")
+    assert python(path) == second
+
+def test_hash_ignores_touch(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "input.txt"
+    path.write_text("same")
+    python = Program(sys.executable, "-c", READ_CODE, cache=MemoryCache(), file_fingerprint="hash")
+    first = python(path)
+    os.utime(path, ns=(0, 0))
+    assert python(path) == first
+    assert python.use(file_fingerprint="stat")(path) != first
+
+def test_input_file(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "input.txt"
+    path.write_text("first")
+    python = Program(sys.executable, "-c", "import sys, time; print(time.perf_counter_ns(), sys.stdin.read())", cache=MemoryCache())
+    first = python(Input(path))
+    assert python(Input(path)) == first
+    path.write_text("second")
+    assert python(Input(path)).endswith("second")
+
+def test_input_files(tmpdir):
+    directory = pathlib.Path(str(tmpdir))
+    (directory / "src").mkdir()
+    (directory / "src" / "a.c").write_text("a")
+    (directory / "config.txt").write_text("config")
+    python = Program(sys.executable, "-c", CODE, cache=MemoryCache(), cwd=str(directory), input_files=["src/**/*.c", "config.txt"])
+    first = python()
+    assert python() == first
+
+    # New file matching the glob
+    (directory / "src" / "b.c").write_text("b")
+    second = python()
+    assert second != first
+    assert python() == second
+
+    (directory / "config.txt").write_text("changed")
+    assert python() != second
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        Cache()
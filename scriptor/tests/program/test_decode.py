@@ -0,0 +1,58 @@
+import sys
+
+import pytest
+from scriptor import Program
+from scriptor.utils import Decoder, to_string
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+@pytest.mark.parametrize("newline,expected", [
+    ("keep", "a\r\nb\rc\n\n"),
+    ("normalize", "a\nb\nc\n\n"),
+    ("strip-trailing", "a\r\nb\rc\n"),
+])
+def test_policy(newline, expected):
+    data = b"a\r\nb\rc\n\n"
+    assert to_string(data, newline=newline) == expected
+
+    # Decoding in chunks gives the same
+    for size in (1, 2, 3):
+        decoder = Decoder(newline=newline)
+        chunks = [decoder.decode(data[i:i+size]) for i in range(0, len(data), size)]
+        assert "".join(chunks) + decoder.decode(final=True) == expected
+
+def test_multibyte_split():
+    data = "äö\r\n".encode("utf-8")
+    decoder = Decoder()
+    text = "".join(decoder.decode(data[i:i+1]) for i in range(len(data)))
+    assert text + decoder.decode(final=True) == "äö"
+
+def test_errors():
+    assert to_string(b"a\xffb", errors="replace") == "a�b"
+    with pytest.raises(UnicodeDecodeError):
+        to_string(b"a\xffb")
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        Decoder(newline="remove")
+
+@param_async
+@pytest.mark.parametrize("newline,expected", [("keep", "a\r\nb\n"), ("normalize", "a\nb\n"), ("strip-trailing", "a\r\nb")])
+async def test_program(sync, newline, expected):
+    python = Program(sys.executable, "-c", "import sys; sys.stdout.buffer.write(b'a\\r\\nb\\n')", newline=newline)
+    output = python() if sync else await python.call_async()
+    assert output == expected
+
+@param_async
+async def test_program_errors(sync):
+    python = Program(sys.executable, "-c", "import sys; sys.stdout.buffer.write(b'a\\xff\\nb\\n')", errors="replace")
+    if sync:
+        lines = list(python.iter())
+    else:
+        lines = [line async for line in python.iter_async()]
+    assert lines == ["a�", "b"]
+    assert python() == "a�\nb"
@@ -0,0 +1,103 @@
+import os
+import sys
+import pathlib
+from textwrap import dedent
+
+import pytest
+from scriptor.program import Program, Input
+from scriptor.utils import copy_fd
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+UPPER_CODE = dedent("""
+    import sys, stat, os
+    # Tell whether stdin is the file itself or a pipe
+    kind = "file" if stat.S_ISREG(os.fstat(0).st_mode) else "pipe"
+    sys.stderr.write(kind)
+    sys.stdout.buffer.write(sys.stdin.buffer.read().upper())
+""")
+
+@pytest.fixture
+def infile(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "input.txt"
+    path.write_bytes(b"abc\n" * 100_000)
+    return path
+
+@param_async
+async def test_input_path(sync, infile):
+    python = Program(sys.executable, "-c", UPPER_CODE, output_type=bytes, output_parser=len)
+    output = python(Input(infile)) if sync else await python.call_async(Input(infile))
+    assert output == 400_000
+
+@param_async
+async def test_input_file_object(sync, infile):
+    python = Program(sys.executable, "-c", "import sys; print(sys.stdin.read())")
+    with open(infile, "rb") as f:
+        # The child continues from the position of the file object
+        f.readline()
+        output = python(Input(f)) if sync else await python.call_async(Input(f))
+    assert output == "abc\n" * 99_999
+
+@param_async
+async def test_output_path(sync, tmpdir, infile):
+    outfile = pathlib.Path(str(tmpdir)) / "output.txt"
+    python = Program(sys.executable, "-c", UPPER_CODE, stdout=outfile)
+    output = python(Input(infile)) if sync else await python.call_async(Input(infile))
+    assert output is None
+    assert outfile.read_bytes() == b"ABC\n" * 100_000
+
+@param_async
+async def test_output_file_object(sync, tmpdir):
+    outfile = pathlib.Path(str(tmpdir)) / "output.txt"
+    with open(outfile, "wb") as f:
+        python = Program(sys.executable, "-c", "print('hello')", stdout=f)
+        output = python() if sync else await python.call_async()
+    assert output is None
+    assert outfile.read_text().strip() == "hello"
+
+def test_handover(infile):
+    python = Program(sys.executable, "-c", UPPER_CODE)
+    proc = python.start(Input(infile))
+    proc.finish()
+    assert proc.get_stderr() == b"file"
+
+def test_stream_file(infile):
+    # A file written to a started process is copied in the kernel
+    python = Program(sys.executable, "-c", UPPER_CODE)
+    proc = python.start()
+    with open(infile, "rb") as f:
+        proc.write(f)
+        proc.finish()
+    assert proc.get_stderr() == b"pipe"
+    assert len(proc.get_stdout()) == 400_000
+
+@param_async
+async def test_pipeline(sync, tmpdir, infile):
+    outfile = pathlib.Path(str(tmpdir)) / "output.txt"
+    upper = Program(sys.executable, "-c", UPPER_CODE)
+    head = Program(sys.executable, "-c", "import sys; sys.stdout.write(sys.stdin.read(8))", stdout=outfile)
+    pipeline = upper | head
+    output = pipeline(Input(infile)) if sync else await pipeline.call_async(Input(infile))
+    assert output is None
+    assert outfile.read_bytes() == b"ABC\nABC\n"
+
+def test_copy_fd_file(tmpdir, infile):
+    outfile = pathlib.Path(str(tmpdir)) / "output.txt"
+    with open(infile, "rb") as src, open(outfile, "wb") as dst:
+        copy_fd(src.fileno(), dst.fileno())
+    assert outfile.read_bytes() == infile.read_bytes()
+
+def test_copy_fd_pipe(tmpdir):
+    # Sized to fit in the pipe
+    path = pathlib.Path(str(tmpdir)) / "input.txt"
+    path.write_bytes(b"x" * 1000)
+    read_fd, write_fd = os.pipe()
+    with open(path, "rb") as src:
+        copy_fd(src.fileno(), write_fd)
+    os.close(write_fd)
+    with open(read_fd, "rb") as reader:
+        assert reader.read() == b"x" * 1000
@@ -0,0 +1,93 @@
+import io
+import sys
+import pathlib
+from textwrap import dedent
+
+import pytest
+from scriptor.program import Program, Input
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+COUNT_CODE = dedent("""
+    import sys
+    data = sys.stdin.buffer.read()
+    print(len(data), data.count(b"x"))
+""")
+
+def get_source(kind, tmpdir, data:bytes):
+    if kind == "path":
+        path = pathlib.Path(str(tmpdir)) / "input.txt"
+        path.write_bytes(data)
+        return path
+    if kind == "file":
+        return io.BytesIO(data)
+    if kind == "generator":
+        return (data[i:i+1000] for i in range(0, len(data), 1000))
+    if kind == "strings":
+        return (data[i:i+1000].decode() for i in range(0, len(data), 1000))
+
+@param_async
+@pytest.mark.parametrize("kind", ["path", "file", "generator", "strings"])
+async def test_stream(tmpdir, sync, kind):
+    # Larger than a pipe buffer
+    data = b"x" * 500_000
+    python = Program(sys.executable, "-c", COUNT_CODE)
+    stdin = Input(get_source(kind, tmpdir, data))
+    assert stdin.is_stream
+    output = python(stdin) if sync else await python.call_async(stdin)
+    assert output == "500000 500000"
+
+@pytest.mark.asyncio
+async def test_stream_async_generator():
+    async def generate():
+        for _ in range(100):
+            yield b"x" * 1000
+    python = Program(sys.executable, "-c", COUNT_CODE)
+    output = await python.call_async(Input(generate()))
+    assert output == "100000 100000"
+
+def test_stream_not_read():
+    # The process exits before reading the input
+    def generate():
+        for _ in range(1000):
+            yield b"x" * 10000
+    python = Program(sys.executable, "-c", "print('done')")
+    assert python(Input(generate())) == "done"
+
+@param_async
+async def test_stream_iter(sync):
+    python = Program(sys.executable, "-c", "import sys\nfor line in sys.stdin: print(line.strip().upper())")
+    stdin = Input(io.BytesIO(b"a\nb\nc\n"))
+    if sync:
+        lines = list(python.iter(stdin))
+    else:
+        lines = [line async for line in python.iter_async(stdin)]
+    assert lines == ["A", "B", "C"]
+
+@param_async
+async def test_stream_pipeline(sync):
+    pipeline = Program(sys.executable, "-c", "import sys\nsys.stdout.write(sys.stdin.read())") | Program(sys.executable, "-c", COUNT_CODE)
+    stdin = Input(b"x" * 1000 for _ in range(200))
+    output = pipeline(stdin) if sync else await pipeline.call_async(stdin)
+    assert output == "200000 200000"
+
+def test_read():
+    assert Input(io.BytesIO(b"data")).read() == b"data"
+    assert Input(iter(["da", "ta"])).read() == b"data"
+    assert not Input("data").is_stream
+
+@param_async
+async def test_stream_source_error(sync):
+    def generate():
+        yield b"abc"
+        raise ValueError("broken source")
+    wc = Program("wc", "-c")
+    with pytest.raises(ValueError, match="broken source"):
+        if sync:
+            wc(Input(generate()))
+        else:
+            await wc.call_async(Input(generate()))
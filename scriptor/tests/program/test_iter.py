@@ -0,0 +1,152 @@
+import sys
+import json
+import time
+from textwrap import dedent
+
+import pytest
+from scriptor.process import ProcessError
+from scriptor.program import Program, Input
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+async def collect(sync, program, *args, **kwargs):
+    if sync:
+        return list(program.iter(*args, **kwargs))
+    return [item async for item in program.iter_async(*args, **kwargs)]
+
+@param_async
+async def test_iter(tmpdir, sync):
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent("""
+        import sys
+        print("Hello")
+        sys.stderr.write("e" * 2**20)
+        print("world" * 2**15)
+        print("!", end="")
+        """
+    ))
+    python = Program(sys.executable)
+    lines = await collect(sync, python, py_file)
+    assert lines == ["Hello", "world" * 2**15, "!"]
+
+    python = Program(sys.executable, output_type=bytes)
+    lines = await collect(sync, python, py_file)
+    assert lines == [b"Hello\n", b"world" * 2**15 + b"\n", b"!"]
+
+def test_iter_program(tmpdir):
+    python = Program(sys.executable, "-c", "print('Hello'); print('world')")
+    assert list(python) == ["Hello", "world"]
+
+@param_async
+async def test_iter_parser(tmpdir, sync):
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent("""
+        print(input())
+        print('{"name": "John"}')
+        """
+    ))
+    python = Program(sys.executable, output_parser=json.loads)
+    lines = await collect(sync, python, py_file, Input('{"name": "Jack"}'))
+    assert lines == [{"name": "Jack"}, {"name": "John"}]
+
+@param_async
+async def test_iter_chunk(tmpdir, sync):
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent("""
+        import sys
+        sys.stdout.buffer.write("äöå".encode("UTF-8") * 3)
+        """
+    ))
+    # Chunks split the characters
+    python = Program(sys.executable, output_type=bytes)
+    chunks = await collect(sync, python, py_file, chunk=4)
+    assert chunks == [b"\xc3\xa4\xc3\xb6", b"\xc3\xa5\xc3\xa4", b"\xc3\xb6\xc3\xa5", b"\xc3\xa4\xc3\xb6", b"\xc3\xa5"]
+
+    python = Program(sys.executable)
+    chunks = await collect(sync, python, py_file, chunk=3)
+    assert "".join(chunks) == "äöå" * 3
+    assert chunks[:2] == ["ä", "öå"]
+
+@param_async
+async def test_iter_error(tmpdir, sync):
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent("""
+        print("Hello")
+        raise RuntimeError("Oops")
+        """
+    ))
+    python = Program(sys.executable)
+    lines = []
+    with pytest.raises(ProcessError) as exc_info:
+        if sync:
+            for line in python.iter(py_file):
+                lines.append(line)
+        else:
+            async for line in python.iter_async(py_file):
+                lines.append(line)
+    assert lines == ["Hello"]
+    assert str(exc_info.value).endswith("RuntimeError: Oops")
+
+@param_async
+async def test_iter_stop(tmpdir, sync):
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent("""
+        import time
+        while True:
+            print("Hello", flush=True)
+            time.sleep(0.01)
+        """
+    ))
+    python = Program(sys.executable)
+    process = python.start(py_file) if sync else await python.start_async(py_file)
+    if sync:
+        lines = iter(process)
+        assert next(lines) == b"Hello\n"
+        lines.close()
+    else:
+        lines = process.__aiter__()
+        async for line in lines:
+            assert line == b"Hello\n"
+            break
+        await lines.aclose()
+    assert process.returncode is not None
+
+    start = time.time()
+    if sync:
+        lines = python.iter(py_file)
+        next(lines)
+        lines.close()
+    else:
+        lines = python.iter_async(py_file)
+        async for line in lines:
+            break
+        await lines.aclose()
+    assert time.time() - start < 1
+
+def test_iter_into(tmpdir):
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent("""
+        import sys
+        sys.stdout.buffer.write(bytes(range(256)) * 1000)
+        """
+    ))
+    python = Program(sys.executable)
+    buffer = bytearray(1000)
+    output = bytearray()
+    for view in python.iter_into(buffer, py_file):
+        assert view.obj is buffer
+        output += view
+    assert output == bytes(range(256)) * 1000
+    assert len(buffer) == 1000
+
+def test_iter_into_error(tmpdir):
+    python = Program(sys.executable, "-c", "print('Hello'); raise RuntimeError('Oops')")
+    output = bytearray()
+    with pytest.raises(ProcessError):
+        for view in python.iter_into(bytearray(3)):
+            output += view
+    assert output.strip() == b"Hello"
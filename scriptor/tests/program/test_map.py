@@ -0,0 +1,62 @@
+import sys
+import time
+from textwrap import dedent
+
+import pytest
+from scriptor.process import ProcessError
+from scriptor.program import Program
+
+async def collect(sync, python, *args, **kwargs):
+    if sync:
+        return list(python.map(*args, **kwargs))
+    return [out async for out in python.map_async(*args, **kwargs)]
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+@pytest.fixture
+def py_file(tmpdir):
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent("""
+        import sys, time
+        time.sleep(float(sys.argv[1]))
+        if sys.argv[1:] == ["0.0", "fail"]:
+            raise RuntimeError("Oops")
+        print(*sys.argv[1:])
+        """
+    ))
+    return py_file
+
+@param_async
+async def test_map_ordered(py_file, sync):
+    python = Program(sys.executable, py_file)
+    output = await collect(sync, python, ["0.3", "0.0", ("0.1", "x")], concurrency=3)
+    assert output == ["0.3", "0.0", "0.1 x"]
+
+@param_async
+async def test_map_unordered(py_file, sync):
+    python = Program(sys.executable, py_file)
+    output = await collect(sync, python, ["0.5", "0.0", "0.2"], concurrency=3, ordered=False)
+    assert output == ["0.0", "0.2", "0.5"]
+
+@param_async
+async def test_map_concurrency(py_file, sync):
+    python = Program(sys.executable, py_file)
+    start = time.time()
+    output = await collect(sync, python, ["0.3"] * 4, concurrency=2)
+    assert output == ["0.3"] * 4
+    # Two rounds of two processes
+    assert time.time() - start >= 0.6
+
+@param_async
+async def test_map_error(py_file, sync):
+    python = Program(sys.executable, py_file)
+    with pytest.raises(ProcessError):
+        await collect(sync, python, ["0.0", ("0.0", "fail")], concurrency=2)
+
+    output = await collect(sync, python, ["0.0", ("0.0", "fail")], concurrency=2, return_exceptions=True)
+    assert output[0] == "0.0"
+    assert isinstance(output[1], ProcessError)
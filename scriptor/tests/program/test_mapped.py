@@ -0,0 +1,70 @@
+import sys
+
+import pytest
+from scriptor import Program, Mapped, MappedOutput
+from scriptor.builtin import current_python
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+@param_async
+async def test_lines(sync):
+    python = Program(sys.executable, "-c", "for i in range(1000): print(i)", stdout=Mapped())
+    with (python() if sync else await python.call_async()) as output:
+        assert isinstance(output, MappedOutput)
+        assert output.line_count == 1000
+        assert output.line(0) == b"0\n"
+        assert output.line(-1) == b"999\n"
+        assert output[:4] == b"0\n1\n"
+        assert isinstance(output[:4], memoryview)
+        assert [bytes(line) for line in output][:2] == [b"0\n", b"1\n"]
+        with pytest.raises(IndexError):
+            output.line(1000)
+
+def test_no_trailing_newline():
+    python = Program(sys.executable, "-c", "import sys; sys.stdout.write('a\\nb')", stdout=Mapped())
+    output = python()
+    assert output.line_count == 2
+    assert output.line(1) == b"b"
+
+def test_binary_parser():
+    # Parsers get a memoryview of the mapping (no copying)
+    def parse(view):
+        return list(view.cast("i"))
+    code = "import sys, struct; sys.stdout.buffer.write(struct.pack('5i', *range(5)))"
+    python = Program(sys.executable, "-c", code, stdout=Mapped(), output_parser=parse)
+    assert python() == [0, 1, 2, 3, 4]
+
+@pytest.mark.parametrize("parser", [memoryview, bytes])
+def test_buffer_parser(parser):
+    python = Program(sys.executable, "-c", "print('hello')", stdout=Mapped(), output_parser=parser)
+    assert python() == b"hello\n"
+
+def test_bytes():
+    output = Program(sys.executable, "-c", "print('hello')", stdout=Mapped())()
+    assert bytes(output) == b"hello\n"
+
+def test_empty():
+    output = Program(sys.executable, "-c", "", stdout=Mapped())()
+    assert len(output) == 0
+    assert output.line_count == 0
+    assert output.find(b"x") == -1
+
+def test_process():
+    python = Program(sys.executable, "-c", "print('hello')", stdout=Mapped())
+    proc = python.start()
+    proc.finish()
+    assert isinstance(proc.get_stdout(), MappedOutput)
+    assert proc.get_stdout().tobytes() == b"hello\n"
+    assert proc.get_stderr() == b""
+
+def test_pool():
+    python = current_python.use_pool(workers=1)
+    try:
+        output = python.use(stdout=Mapped()).run_code("print('hello')")
+        assert output.tobytes() == b"hello\n"
+    finally:
+        python.pool.close()
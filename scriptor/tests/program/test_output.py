@@ -0,0 +1,111 @@
+import sys
+import pathlib
+
+import pytest
+from scriptor import Program, ProcessError, Tee
+from scriptor.builtin import current_python
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+CODE = "import sys; print('out'); print('err', file=sys.stderr)"
+
+@param_async
+async def test_capture(sync):
+    python = Program(sys.executable, "-c", CODE, stdout="capture")
+    output = python() if sync else await python.call_async()
+    assert output == "out"
+
+@param_async
+async def test_discard(sync, capfd):
+    python = Program(sys.executable, "-c", CODE, stdout="discard", stderr="discard")
+    output = python() if sync else await python.call_async()
+    assert output is None
+    assert capfd.readouterr() == ("", "")
+
+@param_async
+async def test_inherit(sync, capfd):
+    python = Program(sys.executable, "-c", CODE, stdout="inherit")
+    output = python() if sync else await python.call_async()
+    assert output is None
+    assert capfd.readouterr().out == "out\n"
+
+@param_async
+async def test_fd(sync, tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "output.txt"
+    with open(path, "wb") as f:
+        python = Program(sys.executable, "-c", CODE, stdout=f.fileno())
+        output = python() if sync else await python.call_async()
+    assert output is None
+    assert path.read_text() == "out\n"
+
+@param_async
+@pytest.mark.parametrize("target", ["path", "file"])
+async def test_tee(sync, tmpdir, target):
+    path = pathlib.Path(str(tmpdir)) / "output.txt"
+    with open(path, "wb") as f:
+        python = Program(sys.executable, "-c", CODE, stdout=Tee(path if target == "path" else f))
+        output = python() if sync else await python.call_async()
+    assert output == "out"
+    assert path.read_text() == "out\n"
+
+@param_async
+async def test_tee_iter(sync, tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "output.txt"
+    python = Program(sys.executable, "-c", "for i in range(3): print(i)", stdout=Tee(path))
+    if sync:
+        lines = list(python.iter())
+    else:
+        lines = [line async for line in python.iter_async()]
+    assert lines == ["0", "1", "2"]
+    assert path.read_text() == "0\n1\n2\n"
+
+@param_async
+async def test_tee_stderr(sync, tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "errors.txt"
+    python = Program(sys.executable, "-c", "import sys; sys.exit('failed')", stderr=Tee(path))
+    with pytest.raises(ProcessError) as exc:
+        python() if sync else await python.call_async()
+    assert str(exc.value).strip() == "failed"
+    assert path.read_text().strip() == "failed"
+
+@param_async
+async def test_error_discarded_stderr(sync):
+    python = Program(sys.executable, "-c", "import sys; sys.exit('failed')", stderr="discard")
+    with pytest.raises(ProcessError) as exc:
+        python() if sync else await python.call_async()
+    assert exc.value.stderr == ""
+    assert "non-zero exit status 1" in str(exc.value)
+
+def test_use():
+    python = Program(sys.executable, "-c", CODE)
+    assert python.use(stdout="discard")() is None
+    assert python() == "out"
+
+def test_invalid_mode():
+    python = Program(sys.executable, "-c", CODE, stdout="nowhere")
+    with pytest.raises(ValueError):
+        python()
+
+@param_async
+async def test_pipeline(sync, tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "output.txt"
+    pipeline = Program(sys.executable, "-c", CODE, stderr="discard") | Program(sys.executable, "-c", "import sys; sys.stdout.write(sys.stdin.read().upper())", stdout=Tee(path))
+    output = pipeline() if sync else await pipeline.call_async()
+    assert output == "OUT"
+    assert path.read_text() == "OUT\n"
+
+@pytest.mark.parametrize("backend", ["pool", "zygote"])
+def test_builtin_backends(tmpdir, backend):
+    path = pathlib.Path(str(tmpdir)) / "output.txt"
+    python = current_python.use_pool(workers=1) if backend == "pool" else current_python.use_zygote()
+    try:
+        assert python.use(stdout=path).run_code("print('hello')") is None
+        assert path.read_text() == "hello\n"
+        assert python.use(stdout=Tee(path)).run_code("print('again')") == "again"
+        assert path.read_text() == "again\n"
+    finally:
+        (python.pool or python.zygote).close()
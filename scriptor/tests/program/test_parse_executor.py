@@ -0,0 +1,79 @@
+import sys
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from scriptor import Program, Spool, MemoryCache
+
+CODE = "import json; print(json.dumps(list(range(200000))))"
+
+def slow_parse(output):
+    time.sleep(0.5)
+    return threading.current_thread()
+
+async def measure_lag(coro) -> float:
+    "Run the coroutine and get the longest stall of the event loop"
+    lag = 0
+    done = False
+    async def tick():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag = max(lag, time.perf_counter() - start - 0.01)
+    ticker = asyncio.ensure_future(tick())
+    try:
+        result = await coro
+    finally:
+        done = True
+        await ticker
+    return result, lag
+
+@pytest.mark.asyncio
+async def test_event_loop():
+    python = Program(sys.executable, "-c", CODE, output_parser=slow_parse)
+    thread, lag = await measure_lag(python.call_async())
+    assert thread is threading.main_thread()
+    assert lag >= 0.4
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor", ["thread", "executor"])
+async def test_thread(executor):
+    with ThreadPoolExecutor(1) as pool:
+        python = Program(sys.executable, "-c", CODE, output_parser=slow_parse, parse_executor="thread" if executor == "thread" else pool)
+        thread, lag = await measure_lag(python.call_async())
+    assert thread is not threading.main_thread()
+    assert lag < 0.4
+
+@pytest.mark.asyncio
+async def test_process():
+    python = Program(sys.executable, "-c", CODE, output_parser=json.loads, parse_executor="process")
+    assert await python.call_async() == list(range(200000))
+
+@pytest.mark.asyncio
+async def test_threshold():
+    python = Program(sys.executable, "-c", "print('small')", output_parser=slow_parse, parse_executor="thread")
+    assert await python.call_async() is threading.main_thread()
+    python = python.use(parse_threshold=0)
+    assert await python.call_async() is not threading.main_thread()
+
+@pytest.mark.asyncio
+async def test_spooled_process():
+    # Parsed in a thread as spooled outputs cannot be sent to processes
+    python = Program(sys.executable, "-c", CODE, stdout=Spool(1000), output_parser=lambda output: len(output.read()), parse_executor="process")
+    assert await python.call_async() > 1000
+
+@pytest.mark.asyncio
+async def test_pipeline():
+    pipeline = Program(sys.executable, "-c", CODE) | Program("cat", output_parser=slow_parse, parse_executor="thread")
+    thread, lag = await measure_lag(pipeline.call_async())
+    assert thread is not threading.main_thread()
+
+@pytest.mark.asyncio
+async def test_process_unpicklable_program():
+    # Only the parsing settings are sent to the process
+    python = Program(sys.executable, "-c", CODE, output_parser=json.loads, parse_executor="process", parse_threshold=0, cache=MemoryCache())
+    assert await python.call_async() == list(range(200000))
@@ -0,0 +1,105 @@
+import sys
+import time
+
+import pytest
+from scriptor import Program, NDJSON, CSV, TSV, Delimited, StreamParser
+from scriptor.runner import run_process_iter, run_process_iter_async
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+def feed_all(parser, data:bytes, size:int) -> list:
+    parser = parser.create()
+    records = []
+    for i in range(0, len(data), size):
+        records += parser.feed(data[i:i+size])
+    return records + parser.close()
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_ndjson(size):
+    data = b'{"a": 1}\n\n[1, "\xc3\xa4"]\r\n2'
+    assert feed_all(NDJSON(), data, size) == [{"a": 1}, [1, "ä"], 2]
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_delimited(size):
+    data = b"a.txt\0dir/b c.txt\0"
+    assert feed_all(Delimited(), data, size) == ["a.txt", "dir/b c.txt"]
+    assert feed_all(Delimited(encoding=None), data, size) == [b"a.txt", b"dir/b c.txt"]
+    assert feed_all(Delimited(b";"), b"a;b", size) == ["a", "b"]
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_csv(size):
+    data = b'name,note\r\nx,"multi\nline, quoted"\ny,""""\n'
+    assert feed_all(CSV(), data, size) == [["name", "note"], ["x", "multi\nline, quoted"], ["y", '"']]
+    assert feed_all(CSV(header=True), data, size) == [{"name": "x", "note": "multi\nline, quoted"}, {"name": "y", "note": '"'}]
+
+def test_csv_unclosed_quote():
+    assert feed_all(CSV(), b'a,"b\nc', 1) == [["a", "b\nc"]]
+
+def test_tsv():
+    assert feed_all(TSV(header=True), b"a\tb\n1\t2\n", 2) == [{"a": "1", "b": "2"}]
+
+@param_async
+async def test_program(sync):
+    code = "import json\nfor i in range(10000): print(json.dumps({'i': i}))"
+    python = Program(sys.executable, "-c", code, stream_parser=NDJSON())
+    if sync:
+        records = list(python.iter())
+    else:
+        records = [record async for record in python.iter_async()]
+    assert records == [{"i": i} for i in range(10000)]
+
+def test_program_stops_early():
+    code = "import json\nwhile True: print(json.dumps({'i': 1}))"
+    python = Program(sys.executable, "-c", code, stream_parser=NDJSON())
+    for record in python.iter(chunk=100):
+        break
+    assert record == {"i": 1}
+
+@param_async
+async def test_program_partial_chunks(sync):
+    # The records are parsed as the output comes
+    code = "import json, time\nprint(json.dumps({'i': 1}), flush=True)\ntime.sleep(5)"
+    python = Program(sys.executable, "-c", code, stream_parser=NDJSON())
+    start = time.monotonic()
+    if sync:
+        for record in python.iter():
+            break
+    else:
+        async for record in python.iter_async():
+            break
+    assert record == {"i": 1}
+    assert time.monotonic() - start < 2
+
+@param_async
+async def test_runner(sync):
+    cmd = [sys.executable, "-c", "import sys; sys.stdout.write('a\\0b\\0')"]
+    if sync:
+        records = list(Delimited().parse(run_process_iter(cmd, chunk=1)))
+    else:
+        records = [record async for record in Delimited().parse_async(run_process_iter_async(cmd, chunk=1))]
+    assert records == ["a", "b"]
+
+def test_long_record():
+    # The chunks of a long record are joined once
+    parser = Delimited(encoding=None).create()
+    for _ in range(2048):
+        assert parser.feed(b"x" * 16384) == []
+    assert parser.feed(b"\0y") == [b"x" * 2**25]
+    assert parser.close() == [b"y"]
+
+def test_csv_long_quoted():
+    # The lines of a quoted field are joined once
+    parser = CSV().create()
+    assert parser.feed(b'a,"x') == []
+    for _ in range(10000):
+        assert parser.feed(b"\ny") == []
+    assert parser.feed(b'"\nb,c\n') == [["a", "x" + "\ny" * 10000], ["b", "c"]]
+    assert parser.close() == []
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        StreamParser()
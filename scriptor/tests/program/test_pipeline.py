@@ -0,0 +1,81 @@
+import sys
+import time
+import shutil
+
+import pytest
+from scriptor import Program, Pipeline, PipelineError, ProcessError
+from scriptor.program import Input
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+UPPER = "import sys; sys.stdout.write(sys.stdin.read().upper())"
+COUNT = "import sys; print(len(sys.stdin.read()))"
+
+@param_async
+async def test_pipeline(sync):
+    pipeline = Program(sys.executable) | Program(sys.executable, "-c", UPPER) | Program(sys.executable, "-c", COUNT, output_parser=int)
+    assert isinstance(pipeline, Pipeline)
+    assert len(pipeline.programs) == 3
+
+    args = ("-c", "print('a' * 2**20)")
+    output = pipeline(*args) if sync else await pipeline.call_async(*args)
+    assert output == 2**20 + 1
+
+@param_async
+async def test_pipeline_input(sync):
+    pipeline = Program(sys.executable, "-c", UPPER).pipe(Program(sys.executable, "-c", UPPER))
+    args = (Input("hello world"),)
+    output = pipeline(*args) if sync else await pipeline.call_async(*args)
+    assert output == "HELLO WORLD"
+
+@param_async
+async def test_pipeline_error(sync):
+    fail = "import sys; sys.stdin.read(); raise RuntimeError('Oops')"
+    pipeline = Program(sys.executable, "-c", fail) | Program(sys.executable, "-c", UPPER) | Program(sys.executable, "-c", fail)
+    with pytest.raises(PipelineError) as exc_info:
+        pipeline(Input("hello")) if sync else await pipeline.call_async(Input("hello"))
+    exc = exc_info.value
+    assert isinstance(exc, ProcessError)
+    assert [i for i, _ in exc.errors] == [0, 2]
+    assert exc.errors[0][1].stderr.endswith("RuntimeError: Oops")
+    assert "Stage 2" in str(exc)
+
+@pytest.mark.skipif(shutil.which("yes") is None, reason="Requires yes")
+@param_async
+async def test_pipeline_early_exit(sync):
+    # First stage gets SIGPIPE when the last stops reading
+    head = "import sys; print(sys.stdin.read(10))"
+    pipeline = Program("yes") | Program(sys.executable, "-c", head)
+    output = pipeline() if sync else await pipeline.call_async()
+    assert output == "y\n" * 5
+
+@param_async
+async def test_pipeline_timeout(sync):
+    sleep = "import time; time.sleep(5)"
+    pipeline = Pipeline(Program(sys.executable, "-c", sleep), Program(sys.executable, "-c", UPPER), timeout=0.2)
+    start = time.time()
+    with pytest.raises(Exception) as exc_info:
+        pipeline() if sync else await pipeline.call_async()
+    assert time.time() - start < 2
+
+@param_async
+async def test_pipeline_stage_timeout(sync):
+    sleep = "import time; time.sleep(5)"
+    pipeline = Program(sys.executable, "-c", sleep, timeout=0.2) | Program(sys.executable, "-c", UPPER) | Program("cat", timeout=10)
+    assert pipeline.timeout == 0.2
+    start = time.time()
+    with pytest.raises(Exception):
+        pipeline() if sync else await pipeline.call_async()
+    assert time.time() - start < 2
+    assert Pipeline(pipeline, Program("cat"), timeout=1).timeout == 1
+
+def test_pipeline_no_sigpipe(monkeypatch):
+    # Without SIGPIPE (Windows) an exit code 1 is not mistaken for it
+    monkeypatch.delattr("signal.SIGPIPE")
+    pipeline = Program(sys.executable, "-c", "import sys; sys.exit(1)") | Program(sys.executable, "-c", "import sys; sys.stdin.read()")
+    with pytest.raises(PipelineError):
+        pipeline()
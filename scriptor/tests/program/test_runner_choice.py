@@ -0,0 +1,99 @@
+import sys
+import asyncio
+
+import pytest
+from scriptor import Program, Scheduler
+from scriptor.runner import Runner, DEFAULT_RUNNER, get_runner, use_runner
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+class RecordingRunner(Runner):
+    "Records the commands it runs"
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+
+    def start_program(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        return super().start_program(cmd, *args, **kwargs)
+
+    async def start_program_async(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        return await super().start_program_async(cmd, *args, **kwargs)
+
+    def run_process_sync(self, cmd, *args, **kwargs):
+        self.commands.append(cmd)
+        return super().run_process_sync(cmd, *args, **kwargs)
+
+PRINT = [sys.executable, "-c", "print('hello')"]
+
+@param_async
+async def test_program_runner(sync):
+    runner = RecordingRunner()
+    python = Program(*PRINT, runner=runner)
+    output = python() if sync else await python.call_async()
+    assert output == "hello"
+    assert runner.commands == [PRINT]
+    assert python.get_runner() is runner
+
+def test_use():
+    runner = RecordingRunner()
+    python = Program(*PRINT)
+    assert python.get_runner() is DEFAULT_RUNNER
+    assert python.use(runner=runner)() == "hello"
+    assert python() == "hello"
+    assert runner.commands == [PRINT]
+
+@param_async
+async def test_context(sync):
+    runner = RecordingRunner()
+    python = Program(*PRINT)
+    with use_runner(runner):
+        assert get_runner() is runner
+        output = python() if sync else await python.call_async()
+        # The program's own runner comes first
+        other = RecordingRunner()
+        python.use(runner=other)()
+    assert get_runner() is DEFAULT_RUNNER
+    assert output == "hello"
+    assert runner.commands == [PRINT]
+    assert other.commands == [PRINT]
+
+@pytest.mark.asyncio
+async def test_context_tasks():
+    # Each task sees the runner of its own context
+    async def run(runner):
+        with use_runner(runner):
+            await asyncio.sleep(0.01)
+            return await Program(*PRINT).call_async()
+    first, second = RecordingRunner(), RecordingRunner()
+    await asyncio.gather(run(first), run(second))
+    assert first.commands == second.commands == [PRINT]
+
+def test_iter_and_start():
+    runner = RecordingRunner()
+    python = Program(*PRINT, runner=runner)
+    assert list(python.iter()) == ["hello"]
+    proc = python.start()
+    proc.finish()
+    assert len(runner.commands) == 2
+
+@param_async
+async def test_pipeline(sync):
+    runner = RecordingRunner()
+    pipeline = Program(*PRINT, runner=runner) | Program("cat")
+    with use_runner(runner):
+        output = pipeline() if sync else await pipeline.call_async()
+    assert output == "hello"
+    assert runner.commands == [PRINT, ["cat"]]
+
+def test_scheduled_runner():
+    scheduler = Scheduler(1)
+    python = Program(*PRINT, runner=Runner(scheduler=scheduler))
+    assert python() == "hello"
+    assert scheduler.metrics()["started"] == 1
@@ -0,0 +1,71 @@
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from scriptor import Program, ProcessError, MemoryCache
+from scriptor.flight import FLIGHTS
+
+CODE = "import os, sys, time; time.sleep(0.3); print(os.getpid(), *sys.argv[1:])"
+
+def test_sync():
+    python = Program(sys.executable, "-c", CODE, single_flight=True)
+    with ThreadPoolExecutor(10) as executor:
+        outputs = list(executor.map(lambda i: python(), range(10)))
+    assert len(set(outputs)) == 1
+    assert len(FLIGHTS) == 0
+    # Not in flight anymore
+    assert python() != outputs[0]
+
+@pytest.mark.asyncio
+async def test_async():
+    python = Program(sys.executable, "-c", CODE, single_flight=True)
+    outputs = await asyncio.gather(*(python.call_async() for _ in range(10)))
+    assert len(set(outputs)) == 1
+    assert len(FLIGHTS) == 0
+
+@pytest.mark.asyncio
+async def test_different_calls():
+    python = Program(sys.executable, "-c", CODE, single_flight=True)
+    outputs = await asyncio.gather(python.call_async("a"), python.call_async("b"), python.call_async("a"))
+    assert outputs[0] == outputs[2]
+    assert outputs[0].split()[0] != outputs[1].split()[0]
+
+@pytest.mark.asyncio
+async def test_error():
+    python = Program(sys.executable, "-c", "import time, sys; time.sleep(0.2); sys.exit('failed')", single_flight=True)
+    results = await asyncio.gather(*(python.call_async() for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ProcessError) for result in results)
+    assert len(set(map(id, results))) == 1
+
+def test_error_sync():
+    python = Program(sys.executable, "-c", "import time, sys; time.sleep(0.2); sys.exit('failed')", single_flight=True)
+    def run(i):
+        try:
+            python()
+        except ProcessError as exc:
+            return exc
+    with ThreadPoolExecutor(3) as executor:
+        results = list(executor.map(run, range(3)))
+    assert len(set(map(id, results))) == 1
+
+@pytest.mark.asyncio
+async def test_cancel_one():
+    python = Program(sys.executable, "-c", CODE, single_flight=True)
+    first = asyncio.ensure_future(python.call_async())
+    second = asyncio.ensure_future(python.call_async())
+    await asyncio.sleep(0.1)
+    first.cancel()
+    output = await second
+    assert output
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+@pytest.mark.asyncio
+async def test_with_cache():
+    cache = MemoryCache()
+    python = Program(sys.executable, "-c", CODE, single_flight=True, cache=cache)
+    outputs = await asyncio.gather(*(python.call_async() for _ in range(5)))
+    assert len(set(outputs)) == 1
+    assert len(cache) == 1
+    assert await python.call_async() == outputs[0]
@@ -0,0 +1,66 @@
+import sys
+
+import pytest
+from scriptor import Program, ProcessError, Spool, SpooledOutput
+from scriptor.builtin import current_python
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+CODE = "import sys\nfor i in range(100000): print(i)\nprint('err', file=sys.stderr)"
+
+@param_async
+@pytest.mark.parametrize("max_size,spilled", [(2**30, False), (1000, True)])
+async def test_spool(sync, max_size, spilled):
+    python = Program(sys.executable, "-c", CODE, stdout=Spool(max_size))
+    with (python() if sync else await python.call_async()) as output:
+        assert isinstance(output, SpooledOutput)
+        assert output.spilled == spilled
+        assert len(output) == len(output.read())
+        lines = list(output)
+        assert len(lines) == 100000
+        assert lines[:2] == [b"0\n", b"1\n"]
+        view = output.mmap()
+        assert view[:4] == b"0\n1\n"
+        assert view.find(b"99999\n") == len(view) - 6
+
+def test_parser():
+    python = Program(sys.executable, "-c", CODE, stdout=Spool(1000), output_parser=lambda out: sum(1 for _ in out))
+    assert python() == 100000
+
+def test_empty():
+    python = Program(sys.executable, "-c", "", stdout=Spool())
+    output = python()
+    assert output.read() == b""
+    assert len(output.mmap()) == 0
+
+@param_async
+async def test_error(sync):
+    python = Program(sys.executable, "-c", CODE + "\nsys.exit(1)", stdout=Spool(1000))
+    with pytest.raises(ProcessError) as exc:
+        python() if sync else await python.call_async()
+    assert isinstance(exc.value.output, SpooledOutput)
+    assert str(exc.value) == "err"
+
+def test_stderr_not_spooled():
+    python = Program(sys.executable, "-c", CODE, stderr=Spool())
+    with pytest.raises(ValueError):
+        python()
+
+@param_async
+async def test_pipeline(sync):
+    pipeline = Program(sys.executable, "-c", CODE) | Program("cat", stdout=Spool(1000))
+    output = pipeline() if sync else await pipeline.call_async()
+    assert output.spilled
+    assert output.read().count(b"\n") == 100000
+
+def test_pool():
+    python = current_python.use_pool(workers=1)
+    try:
+        output = python.use(stdout=Spool()).run_code("print('hello')")
+        assert output.read() == b"hello\n"
+    finally:
+        python.pool.close()
@@ -280,4 +280,31 @@ async def test_process_attrs(tmpdir, sync, how):
     assert repr(process)
     assert process.stdin
     assert process.stdout
-    assert process.stderr
\ No newline at end of file
+    assert process.stderr
+
+@param_async
+@pytest.mark.parametrize("size", [2**20, 5 * 2**20])
+async def test_large_stderr(tmpdir, sync, size):
+    # The stderr is larger than the pipe buffer so
+    # reading stdout before stderr would block
+    py_file = tmpdir.join("myfile.py")
+    py_file.write(dedent(f"""
+        import sys
+        sys.stderr.write("e" * {size})
+        sys.stderr.flush()
+        sys.stdout.write("o" * {size})
+        """
+    ))
+    python = Program(sys.executable, output_type=bytes)
+    process = python.start(py_file) if sync else await python.start_async(py_file)
+
+    if sync:
+        stdout = process.get_stdout()
+    else:
+        stdout = await asyncio.wait_for(process.get_stdout(), timeout=10)
+    stderr = process.get_stderr() if sync else await process.get_stderr()
+    assert stdout == b"o" * size
+    assert stderr == b"e" * size
+
+    process.wait() if sync else await process.wait()
+    assert process.returncode == 0
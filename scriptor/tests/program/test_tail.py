@@ -0,0 +1,86 @@
+import sys
+
+import pytest
+from scriptor import Program, ProcessError, PipelineError, Tail, TailOutput
+from scriptor.builtin import current_python
+
+def param_async(func):
+    mark_async = pytest.mark.asyncio
+    mark_params = pytest.mark.parametrize('sync', [pytest.param(True, id="sync"), pytest.param(False, id="async")])
+
+    return mark_async(mark_params(func))
+
+# Writes 1 000 000 bytes of logs to stderr and fails
+CODE = "import sys\nfor i in range(100000): sys.stderr.write('log %05d\\n' % i)\nsys.exit(1)"
+
+@param_async
+async def test_stderr(sync):
+    python = Program(sys.executable, "-c", CODE, stderr=Tail(1000))
+    with pytest.raises(ProcessError) as exc:
+        python() if sync else await python.call_async()
+    error = exc.value
+    assert error.stderr_dropped == 1_000_000 - 1000
+    assert error.stderr.endswith("log 99999")
+    assert len(error.stderr) == 999
+    assert str(error).startswith("[999000 bytes dropped]\nlog ")
+
+@param_async
+async def test_iter(sync):
+    python = Program(sys.executable, "-c", "print('out')\n" + CODE, stderr=Tail(100))
+    with pytest.raises(ProcessError) as exc:
+        if sync:
+            list(python.iter())
+        else:
+            [line async for line in python.iter_async()]
+    assert exc.value.stderr_dropped == 1_000_000 - 100
+
+def test_stdout():
+    python = Program(sys.executable, "-c", "for i in range(1000): print(i)", stdout=Tail(4), output_type=bytes)
+    output = python()
+    assert isinstance(output, TailOutput)
+    assert output == b"999\n"
+    assert output.dropped == sum(len(f"{i}\n") for i in range(1000)) - 4
+
+def test_lazy_decoding():
+    python = Program(sys.executable, "-c", "import sys; sys.exit('failed')")
+    with pytest.raises(ProcessError) as exc:
+        python()
+    assert exc.value._decoded == {}
+    assert exc.value.stderr.strip() == "failed"
+    assert exc.value.stdout == ""
+    assert exc.value.stderr_dropped == 0
+
+def test_process():
+    python = Program(sys.executable, "-c", CODE, stderr=Tail(10))
+    proc = python.start()
+    proc.finish()
+    assert proc.get_stderr() == b"log 99999\n"
+    assert proc.get_stderr().dropped == 1_000_000 - 10
+
+@param_async
+async def test_pipeline(sync):
+    pipeline = Program(sys.executable, "-c", CODE, stderr=Tail(10)) | Program(sys.executable, "-c", "import sys; sys.stdin.read()")
+    with pytest.raises(PipelineError) as exc:
+        pipeline() if sync else await pipeline.call_async()
+    (i, error), = exc.value.errors
+    assert error.stderr == "log 99999"
+    assert error.stderr_dropped == 1_000_000 - 10
+
+def test_pool():
+    python = current_python.use_pool(workers=1)
+    try:
+        with pytest.raises(ProcessError) as exc:
+            python.use(stderr=Tail(10)).run_code(CODE)
+        assert exc.value.stderr == "log 99999"
+        assert exc.value.stderr_dropped == 1_000_000 - 10
+    finally:
+        python.pool.close()
+
+@param_async
+async def test_cut_multibyte(sync):
+    # The tail starts in the middle of a character
+    python = Program(sys.executable, "-c", "import sys; sys.stderr.write('ä' * 1000); sys.exit(1)", stderr=Tail(101))
+    with pytest.raises(ProcessError) as exc:
+        python() if sync else await python.call_async()
+    assert exc.value.stderr == "�" + "ä" * 50
+    assert str(exc.value).endswith("ä" * 50)
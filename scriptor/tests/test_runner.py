@@ -86,4 +86,28 @@ def test_run_iter_running(tmpdir):
         assert obs > last_check
         last_check = time()
         obs_count += 1
-    assert obs_count == 3
\ No newline at end of file
+    assert obs_count == 3
+
+@pytest.mark.asyncio
+async def test_run_async_large_output():
+    # Output larger than the pipe buffer in both stdout and stderr
+    code = dedent("""
+        import sys
+        sys.stderr.write('e' * 2**20)
+        sys.stdout.write('o' * 10 * 2**20)
+        """)
+    output = await run_process_async([sys.executable, "-c", code], timeout=20)
+    assert output == b"o" * 10 * 2**20
+
+@pytest.mark.asyncio
+async def test_run_async_timeout_kills(tmpdir):
+    file = tmpdir.join("finished.txt")
+    code = dedent(f"""
+        from time import sleep
+        sleep(0.5)
+        open({str(file)!r}, "w").close()
+        """)
+    with pytest.raises(asyncio.TimeoutError):
+        await run_process_async([sys.executable, "-c", code], timeout=0.1)
+    await asyncio.sleep(1)
+    assert not file.exists()
@@ -0,0 +1,155 @@
+import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from scriptor import Program, Scheduler
+from scriptor.runner import Runner
+
+SLEEP = [sys.executable, "-c", "import time; time.sleep(0.2)"]
+
+class Tracker:
+    "Track the most slots held at once"
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.most = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.most = max(self.most, self.current)
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.current -= 1
+
+def test_max_concurrency():
+    scheduler = Scheduler(2)
+    runner = Runner(scheduler=scheduler)
+    with ThreadPoolExecutor(6) as executor:
+        list(executor.map(lambda i: runner.run_process_sync(SLEEP), range(6)))
+    metrics = scheduler.metrics()
+    assert metrics["started"] == 6
+    assert metrics["max_queued"] >= 3
+    assert metrics["wait_max"] >= 0.15
+    assert metrics["running"] == metrics["queued"] == 0
+
+@pytest.mark.asyncio
+async def test_max_concurrency_async():
+    scheduler = Scheduler(2)
+    runner = Runner(scheduler=scheduler)
+    start = time.monotonic()
+    await asyncio.gather(*(runner.run_process_async(SLEEP) for _ in range(4)))
+    assert time.monotonic() - start >= 0.35
+    assert scheduler.metrics()["started"] == 4
+
+def test_threads_and_async():
+    # Slots are shared by the threads and the event loops
+    scheduler = Scheduler(1)
+    tracker = Tracker()
+    def run_sync():
+        with scheduler.slot():
+            with tracker:
+                time.sleep(0.05)
+    async def run_async():
+        async with scheduler.slot_async():
+            with tracker:
+                await asyncio.sleep(0.05)
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(run_sync) for _ in range(3)]
+        futures += [executor.submit(asyncio.run, run_async()) for _ in range(3)]
+        for fut in futures:
+            fut.result()
+    assert tracker.most == 1
+
+def test_priority_and_order():
+    scheduler = Scheduler(1)
+    order = []
+    def run(name, priority):
+        with scheduler.slot(priority=priority):
+            order.append(name)
+    with scheduler.slot():
+        threads = []
+        for name, priority in [("low", "low"), ("first", "normal"), ("high", "high"), ("second", "normal")]:
+            thread = threading.Thread(target=run, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            # Queued in this order
+            while scheduler.queued < len(threads):
+                time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    assert order == ["high", "first", "second", "low"]
+
+def test_quota():
+    scheduler = Scheduler(4, quotas={"slow": 1})
+    tracker = Tracker()
+    def run_slow():
+        with scheduler.slot(group="slow"):
+            with tracker:
+                time.sleep(0.05)
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda i: run_slow(), range(4)))
+        # Other groups are not blocked by the quota
+        with scheduler.slot(group="slow"):
+            with scheduler.slot(group="fast"):
+                assert scheduler.metrics()["groups"] == {"slow": 1, "fast": 1}
+    assert tracker.most == 1
+
+@pytest.mark.asyncio
+async def test_cancel_waiting():
+    scheduler = Scheduler(1)
+    async with scheduler.slot_async():
+        task = asyncio.ensure_future(scheduler.slot_async().__aenter__())
+        await asyncio.sleep(0.01)
+        assert scheduler.queued == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert scheduler.queued == 0
+    assert scheduler.running == 0
+
+def test_interrupt_waiting(monkeypatch):
+    class InterruptedEvent(threading.Event):
+        def wait(self, timeout=None):
+            raise KeyboardInterrupt
+    scheduler = Scheduler(1)
+    with scheduler.slot():
+        monkeypatch.setattr("scriptor.scheduler.threading.Event", InterruptedEvent)
+        # Interrupted in the queue
+        with pytest.raises(KeyboardInterrupt):
+            with scheduler.slot():
+                pass
+        assert scheduler.queued == 0
+    # Interrupted after given the turn
+    with pytest.raises(KeyboardInterrupt):
+        with scheduler.slot():
+            pass
+    assert scheduler.running == scheduler.queued == 0
+    monkeypatch.undo()
+    with scheduler.slot():
+        assert scheduler.running == 1
+
+def test_program_group():
+    scheduler = Scheduler(4, quotas={"sleeper": 1})
+    runner = Runner(scheduler=scheduler)
+    program = Program(*SLEEP, group="sleeper", priority="high")
+    cmd, stdin = program.get_command()
+    kwargs = program.get_process_kwargs()
+    assert kwargs["group"] == "sleeper"
+    start = time.monotonic()
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(lambda i: runner.run_process_sync(cmd, **program.get_process_kwargs()), range(2)))
+    assert time.monotonic() - start >= 0.35
+
+def test_iter():
+    scheduler = Scheduler(1)
+    runner = Runner(scheduler=scheduler)
+    output = runner.run_process_iter([sys.executable, "-c", "print(1); print(2)"])
+    assert next(output) == b"1\n"
+    assert scheduler.running == 1
+    output.close()
+    assert scheduler.running == 0
@@ -0,0 +1,129 @@
+import os
+import time
+import signal
+import sys
+import subprocess
+import platform
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from textwrap import dedent
+
+import pytest
+
+from scriptor import Program
+from scriptor.runner import Runner
+from scriptor.process import ProcessError
+from scriptor.spawn import SpawnHelper, SpawnedProcess, posix_spawn
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="Spawn helper requires Unix sockets")
+
+@pytest.fixture(scope="module")
+def runner():
+    with SpawnHelper() as helper:
+        yield Runner(popen=helper)
+
+def test_run_sync(runner):
+    code = dedent("""
+        import os, sys
+        print(input())
+        print(os.getcwd())
+        sys.stderr.write('e' * 2**20)
+        """)
+    output = runner.run_process_sync([sys.executable, "-c", code], input=b"Hello", cwd="/")
+    assert output == b"Hello\n/\n"
+
+def test_run_error(runner):
+    with pytest.raises(ProcessError) as exc_info:
+        runner.run_process_sync([sys.executable, "-c", "raise RuntimeError('Oops')"])
+    assert exc_info.value.returncode == 1
+    assert str(exc_info.value).endswith("RuntimeError: Oops")
+
+    with pytest.raises(FileNotFoundError):
+        runner.run_process_sync(["non-existent-program"])
+
+def test_start(runner):
+    proc = runner.start_program([sys.executable, "-c", "import os; print(os.getppid())"])
+    assert proc.wait() == 0
+    # Launched by the helper, not by us
+    assert int(proc.read()) != os.getpid()
+
+def test_iter(runner):
+    lines = list(runner.run_process_iter([sys.executable, "-c", "print('Hello'); print('world')"]))
+    assert lines == [b"Hello\n", b"world\n"]
+
+def test_helper_closed():
+    helper = SpawnHelper()
+    proc = helper([sys.executable, "-c", "import time; time.sleep(4)"])
+    helper.close()
+    # Still running after the helper is gone
+    assert proc.poll() is None
+    with pytest.raises(subprocess.TimeoutExpired):
+        proc.wait(timeout=0.1)
+    proc.kill()
+    # The exit status is not known
+    assert proc.wait(timeout=2) == -1
+
+def test_posix_spawn_run():
+    runner = Runner(popen=partial(posix_spawn, close_fds=False))
+    code = dedent("""
+        import os, sys
+        print(input())
+        print(os.environ.get("MY_VAR"))
+        sys.stderr.write('e' * 2**20)
+        """)
+    output = runner.run_process_sync([sys.executable, "-c", code], input=b"Hello", env={"MY_VAR": "world"})
+    assert output == b"Hello\nworld\n"
+
+    proc = runner.start_program([sys.executable, "-c", "print('Hello')"])
+    assert isinstance(proc._proc, SpawnedProcess)
+    assert proc.wait() == 0
+    assert proc.read() == b"Hello\n"
+
+    with pytest.raises(ProcessError):
+        runner.run_process_sync([sys.executable, "-c", "raise RuntimeError('Oops')"])
+    with pytest.raises(FileNotFoundError):
+        runner.run_process_sync(["non-existent-program"])
+
+    # Found from PATH
+    assert runner.run_process_sync(["python3", "-c", "print('Hello')"]) == b"Hello\n"
+
+def test_posix_spawn_fallback(tmpdir):
+    runner = Runner(popen=posix_spawn)
+    proc = runner.start_program([sys.executable, "-c", "import os; print(os.getcwd())"], cwd=str(tmpdir))
+    assert isinstance(proc._proc, subprocess.Popen)
+    assert proc.wait() == 0
+    assert proc.read() == f"{tmpdir}\n".encode()
+
+@pytest.mark.parametrize("close_fds", [True, False])
+def test_posix_spawn_close_fds(close_fds):
+    read_fd, write_fd = os.pipe()
+    try:
+        os.set_inheritable(write_fd, True)
+        code = f"import os; os.fstat({write_fd})"
+        proc = posix_spawn([sys.executable, "-c", code], stderr=subprocess.DEVNULL, close_fds=close_fds)
+        if not close_fds:
+            assert isinstance(proc, SpawnedProcess)
+        # Passed to the child only if not closed
+        assert proc.wait() == (1 if close_fds else 0)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+def test_posix_spawn_kill_while_waiting():
+    proc = posix_spawn([sys.executable, "-c", "import time; time.sleep(4)"], close_fds=False)
+    with ThreadPoolExecutor(1) as executor:
+        waiting = executor.submit(proc.wait)
+        time.sleep(0.1)
+        start = time.monotonic()
+        proc.kill()
+        assert waiting.result() == -signal.SIGKILL
+    assert time.monotonic() - start < 1
+
+@pytest.mark.parametrize("backend", ["helper", "posix_spawn"])
+def test_timeout(runner, backend):
+    runner = runner if backend == "helper" else Runner(popen=partial(posix_spawn, close_fds=False))
+    python = Program(sys.executable, "-c", "import time; time.sleep(4)", stdout="discard", stderr="discard", timeout=0.5, runner=runner)
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        python()
+    assert time.monotonic() - start < 2
@@ -1,16 +1,196 @@
-from typing import Union
+from typing import AsyncIterator, Iterator, Optional, Union
 import io
+import os
+import errno
+import codecs
 
-def to_string(s:Union[str, bytes], **kwargs) -> str:
+try:
+    from typing import Literal
+except ImportError: # pragma: no cover
+    from typing_extensions import Literal
+
+NewlinePolicy = Literal['keep', 'normalize', 'strip-trailing']
+
+def strip_newline(text:str) -> str:
+    "Remove one line break from the end"
+    if text.endswith('\r\n'):
+        return text[:-2]
+    if text.endswith(('\n', '\r')):
+        return text[:-1]
+    return text
+
+def _strip_newline_bytes(data) -> memoryview:
+    # Sliced without copying
+    view = memoryview(data)
+    end = view[-2:].tobytes()
+    if end == b'\r\n':
+        return view[:-2]
+    if end.endswith((b'\n', b'\r')):
+        return view[:-1]
+    return view
+
+class Decoder:
+    """Incremental decoder for outputs
+
+    The newline policy is 'keep' (as is), 'normalize'
+    ("\\r\\n" and "\\r" to "\\n") or 'strip-trailing' (remove
+    the line break from the end of the output, normalized
+    only on Windows). The errors are as in bytes.decode."""
+
+    def __init__(self, encoding:str='utf-8', errors:str='strict', newline:NewlinePolicy='strip-trailing'):
+        if newline not in ('keep', 'normalize', 'strip-trailing'):
+            raise ValueError(f"Invalid newline policy: {newline!r}")
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors)
+        self._strip = newline == 'strip-trailing'
+        self._normalize = newline == 'normalize' or (self._strip and os.name == 'nt')
+        # The line breaks can be stripped from the bytes
+        self._ascii_newlines = codecs.encode('\r\n', encoding) == b'\r\n'
+        self._started = False
+        self._pending = ''
+
+    def decode(self, data=b'', final:bool=False) -> str:
+        "Decode a chunk of the output (final for the last)"
+        if final and not self._started and self._strip and not self._normalize and self._ascii_newlines:
+            # All at once, strip before decoding to not copy the text
+            return self._decoder.decode(_strip_newline_bytes(data), True)
+        self._started = True
+        text = self._pending + self._decoder.decode(data, final)
+        self._pending = ''
+        if not final:
+            # Hold back what depends on the next chunk
+            if self._strip:
+                held = len(text) - len(text.rstrip('\r\n'))
+            else:
+                held = int(self._normalize and text.endswith('\r'))
+            if held:
+                text, self._pending = text[:-held], text[-held:]
+        if self._normalize:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if final and self._strip:
+            text = strip_newline(text)
+        return text
+
+    def decode_line(self, data) -> str:
+        "Decode a line (the policy applies to its line break)"
+        line = self._decoder.decode(data)
+        if self._normalize:
+            line = line.replace('\r\n', '\n').replace('\r', '\n')
+        if self._strip:
+            line = strip_newline(line)
+        return line
+
+def to_string(s:Union[str, bytes], encoding:str='utf-8', errors:str='strict', newline:NewlinePolicy='strip-trailing') -> str:
     if isinstance(s, str):
         return s
     elif isinstance(s, io.BufferedReader):
         s = s.read()
-    s = s.decode(**kwargs)
-    # Turn "\r\n" to "\n" (Windows)
-    return "\n".join(s.splitlines())
+    return Decoder(encoding, errors, newline).decode(s, final=True)
 
 def to_bytes(s:Union[str, bytes], **kwargs) -> bytes:
     if isinstance(s, bytes):
         return s
-    return s.encode(**kwargs)
\ No newline at end of file
+    return s.encode(**kwargs)
+
+def iter_bytes(source, chunk_size:int=65536) -> Iterator[bytes]:
+    """Iterate a source as chunks of bytes
+
+    The source can be bytes, string, path, file
+    object or an iterable of bytes or strings."""
+    if source is None:
+        return
+    if isinstance(source, (bytes, str)):
+        yield to_bytes(source)
+    elif isinstance(source, os.PathLike):
+        with open(source, 'rb') as file:
+            yield from iter_bytes(file, chunk_size)
+    elif isinstance(source, io.IOBase) or (hasattr(source, 'read') and not hasattr(source, '__iter__')):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield to_bytes(chunk)
+    elif hasattr(source, '__iter__'):
+        for chunk in source:
+            if chunk:
+                yield to_bytes(chunk)
+    else:
+        raise TypeError(f"Cannot iterate bytes from {type(source).__name__}")
+
+async def aiter_bytes(source, chunk_size:int=65536) -> AsyncIterator[bytes]:
+    """Iterate a source as chunks of bytes async
+
+    In addition to what iter_bytes supports, the
+    source can be an async iterable."""
+    if hasattr(source, '__aiter__'):
+        async for chunk in source:
+            if chunk:
+                yield to_bytes(chunk)
+    else:
+        for chunk in iter_bytes(source, chunk_size):
+            yield chunk
+
+def get_fileno(source) -> Optional[int]:
+    """Get the OS file descriptor of a file object (None
+    if it has no such, ie. BytesIO)
+
+    The position of the descriptor is synced with the
+    position of the file object (buffered read-ahead)."""
+    try:
+        fileno = source.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    try:
+        if source.seekable():
+            os.lseek(fileno, source.tell(), os.SEEK_SET)
+    except (AttributeError, OSError, ValueError):
+        pass
+    return fileno
+
+# Errors meaning the kernel cannot copy between the fds
+_NOT_SUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.ESPIPE, getattr(errno, 'ENOTSUP', errno.EINVAL), getattr(errno, 'EOPNOTSUPP', errno.EINVAL)}
+
+def _copy_kernel(copy, src:int, dst:int, chunk_size:int) -> bool:
+    "Copy with os.splice or os.sendfile (False if not supported for the fds)"
+    first = True
+    while True:
+        try:
+            size = copy(src, dst, chunk_size)
+        except OSError as exc:
+            if first and exc.errno in _NOT_SUPPORTED:
+                return False
+            raise
+        if not size:
+            return True
+        first = False
+
+def copy_fd(src:int, dst:int, chunk_size:int=2**20):
+    """Copy from a file descriptor to another until EOF
+
+    Uses os.splice (one of them is a pipe) or os.sendfile
+    (Linux) so that the data does not pass through Python,
+    and a buffered copy otherwise."""
+    if hasattr(os, 'splice') and _copy_kernel(os.splice, src, dst, chunk_size):
+        return
+    if hasattr(os, 'sendfile') and _copy_kernel(lambda src, dst, size: os.sendfile(dst, src, None, size), src, dst, chunk_size):
+        return
+    while True:
+        chunk = os.read(src, chunk_size)
+        if not chunk:
+            return
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst, view):]
+
+def write_to(target, data:bytes):
+    "Write the data to a path, file descriptor or file object"
+    if isinstance(target, os.PathLike):
+        with open(target, 'wb') as file:
+            file.write(data)
+    elif isinstance(target, int):
+        with open(target, 'wb', closefd=False) as file:
+            file.write(data)
+    else:
+        # Binary even if the file is in text mode
+        file = getattr(target, 'buffer', target)
+        file.write(data)
+        file.flush()